@@ -0,0 +1,121 @@
+import os
+import csv
+import json
+import time
+import argparse
+import yaml
+import numpy as np
+
+from ocr_engine import create_ocr_engine
+from receipt_parser_paddle_multi_thread import get_img_arr_from_file_name, extract_receipt_fields
+
+# ===============================
+# OCR 백엔드 벤치마크 (속도 + 필드 추출 정확도)
+# ===============================
+# 사용 예)
+#   python benchmark_ocr.py --images ./test_images --backends paddle onnx --out bench_ocr.json
+#   python benchmark_ocr.py --images ./test_images --labels receipt_result.csv
+#
+# --labels 는 receipt_parser_paddle_multi_thread.py 가 만드는 CSV 와 같은 열을 사용한다.
+#   original_file, merchant_name, business_number, payment_date, payment_amount
+# 정답 CSV 가 없으면 첫 번째 백엔드의 결과를 기준으로 일치율을 계산한다.
+
+FIELDS = ["pay_date", "biz_no", "merchant", "amount"]
+LABEL_COLUMNS = {
+    "pay_date": "payment_date",
+    "biz_no": "business_number",
+    "merchant": "merchant_name",
+    "amount": "payment_amount",
+}
+
+def load_labels(csv_path):
+    labels = {}
+    with open(csv_path, "r", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            labels[row["original_file"]] = {k: row[c] for k, c in LABEL_COLUMNS.items()}
+    return labels
+
+def run_backend(engine_conf, images, repeat):
+    engine = create_ocr_engine(engine_conf)
+
+    # 첫 호출은 모델 로드/그래프 최적화 시간이 섞이므로 제외
+    engine.ocr(images[0][1])
+
+    latencies = []
+    fields = {}
+    for name, img_arr in images:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ocr_res = engine.ocr(img_arr)[0]
+            latencies.append(time.perf_counter() - start)
+        try:
+            fields[name] = extract_receipt_fields(ocr_res)
+        except Exception as e:
+            print("Failed to extract : ", name, e)
+            fields[name] = {k: None for k in FIELDS}
+    return latencies, fields
+
+def field_accuracy(fields, reference):
+    acc = {}
+    for k in FIELDS:
+        names = [n for n in reference if n in fields]
+        if not names:
+            continue
+        hit = sum(str(fields[n][k]) == str(reference[n][k]) for n in names)
+        acc[k] = round(hit / len(names), 4)
+    return acc
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR 백엔드 속도/정확도 비교")
+    parser.add_argument("--images", default="./test_images")
+    parser.add_argument("--labels", default=None, help="정답 CSV (없으면 첫 번째 백엔드 기준)")
+    parser.add_argument("--backends", nargs="+", default=["paddle", "onnx"])
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--out", default="bench_ocr.json")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    engine_conf = config.get("ocr_engine", {})
+
+    file_names = sorted(f for f in os.listdir(args.images)
+                        if f.lower().endswith((".jpg", ".png", ".jpeg", ".pdf")))
+    # 이미지 디코딩 시간은 빼고 OCR 시간만 비교하기 위해 미리 읽어둔다.
+    images = [(f, get_img_arr_from_file_name(os.path.join(args.images, f))) for f in file_names]
+    print(f"▶ {len(images)} images")
+
+    reference = load_labels(args.labels) if args.labels else None
+    report = {"images": len(images), "repeat": args.repeat, "backends": {}}
+
+    for backend in args.backends:
+        conf = dict(engine_conf, backend=backend)
+        latencies, fields = run_backend(conf, images, args.repeat)
+        if reference is None:
+            reference = fields
+
+        lat_ms = np.array(latencies) * 1000
+        report["backends"][backend] = {
+            "images_per_sec": round(len(latencies) / sum(latencies), 3),
+            "latency_ms": {
+                "mean": round(float(lat_ms.mean()), 1),
+                "p50": round(float(np.percentile(lat_ms, 50)), 1),
+                "p95": round(float(np.percentile(lat_ms, 95)), 1),
+            },
+            "field_accuracy": field_accuracy(fields, reference),
+            "fields": fields,
+        }
+
+    print()
+    print(f"{'backend':<10}{'img/s':>8}{'mean':>9}{'p95':>9}  " + "  ".join(f"{k:>9}" for k in FIELDS))
+    for backend, r in report["backends"].items():
+        acc = r["field_accuracy"]
+        print(f"{backend:<10}{r['images_per_sec']:>8}{r['latency_ms']['mean']:>9}{r['latency_ms']['p95']:>9}  "
+              + "  ".join(f"{acc.get(k, '-'):>9}" for k in FIELDS))
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4, default=str)
+    print("✅ saved:", args.out)
+
+if __name__ == "__main__":
+    main()
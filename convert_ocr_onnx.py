@@ -0,0 +1,97 @@
+import os
+import shutil
+import argparse
+import subprocess
+import yaml
+
+# ===============================
+# PaddleOCR 한국어 det/rec 모델 -> ONNX 변환 및 int8 양자화
+# ===============================
+# 사용 예)
+#   pip install paddle2onnx onnxruntime
+#   python convert_ocr_onnx.py --out_dir models/onnx
+#
+# PaddleOCR(lang="korean") 를 한 번 실행하면 아래 기본 경로에 모델이 내려받아진다.
+#   ~/.paddlex/official_models/PP-OCRv5_server_det
+#   ~/.paddlex/official_models/korean_PP-OCRv5_mobile_rec
+# 결과물 (config.yaml 의 ocr_engine.onnx 에 지정)
+#   det.onnx / det_int8.onnx(--quantize_det) / rec.onnx / rec_int8.onnx / korean_dict.txt
+
+PADDLEX_MODEL_DIR = os.path.expanduser("~/.paddlex/official_models")
+DEFAULT_DET_MODEL = os.path.join(PADDLEX_MODEL_DIR, "PP-OCRv5_server_det")
+DEFAULT_REC_MODEL = os.path.join(PADDLEX_MODEL_DIR, "korean_PP-OCRv5_mobile_rec")
+
+def paddle_to_onnx(model_dir, save_file, opset_version=11):
+    # PaddleX 3.x 모델은 inference.json, 이전 모델은 inference.pdmodel
+    if os.path.exists(os.path.join(model_dir, "inference.json")):
+        model_filename = "inference.json"
+    else:
+        model_filename = "inference.pdmodel"
+
+    if shutil.which("paddle2onnx") is None:
+        raise RuntimeError("paddle2onnx 가 설치되어 있지 않습니다. (pip install paddle2onnx)")
+
+    cmd = ["paddle2onnx",
+           "--model_dir", model_dir,
+           "--model_filename", model_filename,
+           "--params_filename", "inference.pdiparams",
+           "--save_file", save_file,
+           "--opset_version", str(opset_version)]
+    print("▶", " ".join(cmd))
+    subprocess.run(cmd, check=True)
+    return save_file
+
+def quantize_int8(onnx_path, out_path):
+    """
+    가중치 int8 동적 양자화 (calibration 데이터 불필요)
+    MatMul/Gemm 만 int8 커널(MatMulInteger)로 바꾸고 Conv 는 float 로 둔다.
+    (Conv 까지 양자화하면 ConvInteger 노드가 생기는데, onnxruntime CPU 의 ConvInteger 는
+     버전에 따라 int8 가중치를 지원하지 않아 NOT_IMPLEMENTED 로 로드에 실패한다.)
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(onnx_path, out_path, weight_type=QuantType.QInt8,
+                     op_types_to_quantize=["MatMul", "Gemm"])
+    # 변환 직후 CPU 에서 로드되는지 확인 (서버 시작 때 처음 실패하지 않도록)
+    ort.InferenceSession(out_path, providers=["CPUExecutionProvider"])
+    print("▶ quantized:", out_path,
+          f"({os.path.getsize(onnx_path) // 1024}KB -> {os.path.getsize(out_path) // 1024}KB)")
+    return out_path
+
+def export_rec_dict(rec_model_dir, out_path):
+    # rec 모델의 inference.yml 에 CTC 문자 사전이 들어 있다.
+    yml_path = os.path.join(rec_model_dir, "inference.yml")
+    if not os.path.exists(yml_path):
+        raise FileNotFoundError(f"inference.yml 이 없습니다: {rec_model_dir}")
+    with open(yml_path, "r", encoding="utf-8") as f:
+        conf = yaml.safe_load(f)
+    chars = conf["PostProcess"]["character_dict"]
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(chars))
+    print("▶ dict:", out_path, f"({len(chars)} chars)")
+    return out_path
+
+def main():
+    parser = argparse.ArgumentParser(description="PaddleOCR 한국어 모델 ONNX 변환/양자화")
+    parser.add_argument("--det_model_dir", default=DEFAULT_DET_MODEL)
+    parser.add_argument("--rec_model_dir", default=DEFAULT_REC_MODEL)
+    parser.add_argument("--out_dir", default="models/onnx")
+    parser.add_argument("--opset_version", type=int, default=11)
+    parser.add_argument("--quantize_det", action="store_true",
+                        help="det 모델도 int8 로 양자화 (정확도 하락 폭을 benchmark_ocr.py 로 확인할 것)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    det_onnx = paddle_to_onnx(args.det_model_dir, os.path.join(args.out_dir, "det.onnx"), args.opset_version)
+    rec_onnx = paddle_to_onnx(args.rec_model_dir, os.path.join(args.out_dir, "rec.onnx"), args.opset_version)
+
+    quantize_int8(rec_onnx, os.path.join(args.out_dir, "rec_int8.onnx"))
+    if args.quantize_det:
+        quantize_int8(det_onnx, os.path.join(args.out_dir, "det_int8.onnx"))
+
+    export_rec_dict(args.rec_model_dir, os.path.join(args.out_dir, "korean_dict.txt"))
+    print("✅ 변환 완료")
+
+if __name__ == "__main__":
+    main()
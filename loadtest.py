@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageDraw
+
+from nts_mock_server import MockBehavior, start_mock_server, STATUS_PATH
+
+# ===============================
+# 부하 테스트 (동시 업로드 시나리오)
+# ===============================
+# 로컬 국세청 mock 서버 + 별도 설정의 main.py 를 띄우고, N 명의 가상 사용자가 동시에
+#   /api/upload_files (M 장) -> /api/retry_tax -> /api/download_all 을 호출한다.
+# 사용자는 IP 로 구분되므로 127.0.0.X 를 출발지 주소로 사용한다. (Linux 의 loopback 대역)
+#
+# 사용 예)
+#   python loadtest.py --users 8 --receipts 20 --mock_latency_ms 200 --mock_error_rate 0.05 --out run1.json
+#   python loadtest.py --users 8 --receipts 20 --out run2.json --compare run1.json
+#   python loadtest.py --server http://127.0.0.1:8080 ...   (이미 떠 있는 서버 대상, mock 은 직접 설정)
+
+def percentiles(values):
+    if not values:
+        return {}
+    arr = np.array(values) * 1000
+    return {"count": len(values),
+            "mean_ms": round(float(arr.mean()), 1),
+            "p50_ms": round(float(np.percentile(arr, 50)), 1),
+            "p95_ms": round(float(np.percentile(arr, 95)), 1),
+            "p99_ms": round(float(np.percentile(arr, 99)), 1),
+            "max_ms": round(float(arr.max()), 1)}
+
+class SourceAddressAdapter(HTTPAdapter):
+    # 가상 사용자마다 다른 출발지 IP 로 접속 (서버는 IP 로 사용자 폴더를 나눈다)
+    def __init__(self, source_ip, **kwargs):
+        self.source_ip = source_ip
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["source_address"] = (self.source_ip, 0)
+        super().init_poolmanager(*args, **kwargs)
+
+def make_session(source_ip):
+    session = requests.Session()
+    adapter = SourceAddressAdapter(source_ip)
+    session.mount("http://", adapter)
+    return session
+
+# --- 합성 영수증 ---
+def make_synthetic_receipts(out_dir, count, seed=0):
+    """
+    파서가 읽을 수 있는 형식의 가짜 영수증 이미지 생성
+    모두 같은 양식이라 중복 검출에 걸릴 수 있으므로 start_app 에서 dedup 을 끈다. (--dedup 로 켤 수 있음)
+    """
+    from receipt_parser_paddle_multi_thread import get_system_font
+    rng = random.Random(seed)
+    font = get_system_font(28)
+    paths = []
+    for i in range(count):
+        biz_no = f"{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10000, 99999)}"
+        amount = rng.randint(3, 300) * 1000
+        lines = [
+            f"가맹점명: 부하테스트식당{i}",
+            f"사업자번호: {biz_no}",
+            "거래일시",
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:{rng.randint(0, 59):02d}",
+            f"합계 {amount:,}원",
+            f"승인번호 {rng.randint(10000000, 99999999)}",
+        ]
+        img = Image.new("RGB", (720, 80 + 60 * len(lines)), "white")
+        draw = ImageDraw.Draw(img)
+        for j, line in enumerate(lines):
+            draw.text((40, 40 + 60 * j), line, font=font, fill="black")
+        path = os.path.join(out_dir, f"receipt_{i:04d}.png")
+        img.save(path)
+        paths.append(path)
+    return paths
+
+# --- 서버 실행 ---
+def start_app(port, mock_url, work_dir, dedup=False):
+    """부하 테스트 전용 설정/저장소로 main.py 를 띄운다."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(repo_dir, "config.yaml"), "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config["server"]["port"] = port
+    config["ocr"].update({
+        "default_service_key": "LOADTEST_KEY",
+        "upload_dir": os.path.join(work_dir, "uploads"),
+        "result_dir": os.path.join(work_dir, "ocr_result"),
+        "thumb_dir": os.path.join(work_dir, "thumb"),
+        "raw_dir": os.path.join(work_dir, "ocr_raw"),
+    })
+    config.setdefault("storage", {})["trash_dir"] = os.path.join(work_dir, "trash")
+    # 중복 영수증은 OCR 을 건너뛰므로 기본은 끄고 OCR 자체를 측정한다.
+    config.setdefault("dedup", {}).update(enabled=dedup, index_dir=os.path.join(work_dir, "dedup_index"))
+    nts = config.setdefault("nts", {})
+    nts["api_url"] = mock_url
+    nts["db_path"] = os.path.join(work_dir, "nts_limiter.db")
+    nts["usage_log"] = os.path.join(work_dir, "usage_log.json")   # mock 호출이 실제 사용량 기록에 섞이지 않도록
+    nts["daily_quota"] = 10 ** 9    # 부하 테스트가 실제 일일 한도 집계에 섞이지 않도록 별도 DB + 무제한
+    if config.get("distributed", {}).get("enabled"):
+        config["distributed"]["broker_db"] = os.path.join(work_dir, "broker.db")
+
+    config_path = os.path.join(work_dir, "config.yaml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+    env = dict(os.environ, RECEIPT_CONFIG=config_path)
+    log = open(os.path.join(work_dir, "server.log"), "w")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app",
+                             "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=repo_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    server = f"http://127.0.0.1:{port}"
+    for _ in range(120):
+        if proc.poll() is not None:
+            raise RuntimeError(f"서버 실행 실패: {os.path.join(work_dir, 'server.log')}")
+        try:
+            requests.get(server + "/api/usage", timeout=1)
+            return proc, server
+        except requests.RequestException:
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("서버 응답 없음")
+
+# --- 가상 사용자 ---
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {"upload": [], "first_line": [], "retry_tax": [], "download_all": []}
+        self.requests = {k: 0 for k in self.latency if k != "first_line"}
+        self.http_errors = {k: 0 for k in self.requests}
+        self.records = 0
+        self.error_records = 0
+        self.tax_errors = 0
+        self.duplicates = 0     # OCR 을 건너뛴 중복 영수증 레코드
+        self.downloaded_bytes = 0
+
+    def add(self, key, value):
+        with self.lock:
+            self.latency[key].append(value)
+
+def run_user(user_idx, server, receipt_paths, args, metrics):
+    session = make_session(f"127.0.0.{user_idx + 2}")
+    session.get(server + "/", timeout=30)   # 페이지 접속 (이전 데이터 정리)
+
+    # 1. 업로드 + NDJSON 스트림
+    chosen = [receipt_paths[(user_idx * args.receipts + k) % len(receipt_paths)] for k in range(args.receipts)]
+    files = [("files", (os.path.basename(p), open(p, "rb"), "image/png")) for p in chosen]
+    biz_nos = []
+    start = time.perf_counter()
+    first_line = None
+    try:
+        with metrics.lock: metrics.requests["upload"] += 1
+        r = session.post(server + "/api/upload_files", files=files,
+                         data={"user_key": ""}, stream=True, timeout=args.timeout)
+        if r.status_code != 200:
+            with metrics.lock: metrics.http_errors["upload"] += 1
+        else:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                if first_line is None:
+                    first_line = time.perf_counter() - start
+                record = json.loads(line)
+                with metrics.lock:
+                    metrics.records += 1
+                    if record.get("status") != "success":
+                        metrics.error_records += 1
+                    elif record["data"].get("tax_type") == "오류":
+                        metrics.tax_errors += 1
+                    if record.get("duplicate"):
+                        metrics.duplicates += 1
+                if record.get("status") == "success" and record["data"].get("biz_no"):
+                    biz_nos.append(record["data"]["biz_no"])
+    except requests.RequestException:
+        with metrics.lock: metrics.http_errors["upload"] += 1
+    finally:
+        for _, (_, fp, _) in files:
+            fp.close()
+    metrics.add("upload", time.perf_counter() - start)
+    if first_line is not None:
+        metrics.add("first_line", first_line)
+
+    # 2. 과세유형 재조회
+    for biz_no in biz_nos[:args.retry_tax]:
+        start = time.perf_counter()
+        try:
+            with metrics.lock: metrics.requests["retry_tax"] += 1
+            r = session.post(server + "/api/retry_tax", data={"biz_no": biz_no, "user_key": ""}, timeout=args.timeout)
+            if r.status_code != 200:
+                with metrics.lock: metrics.http_errors["retry_tax"] += 1
+        except requests.RequestException:
+            with metrics.lock: metrics.http_errors["retry_tax"] += 1
+        metrics.add("retry_tax", time.perf_counter() - start)
+
+    # 3. 전체 다운로드
+    for kind in ["origin", "vis"][:args.download]:
+        start = time.perf_counter()
+        try:
+            with metrics.lock: metrics.requests["download_all"] += 1
+            r = session.get(f"{server}/api/download_all/{kind}", timeout=args.timeout)
+            if r.status_code != 200:
+                with metrics.lock: metrics.http_errors["download_all"] += 1
+            with metrics.lock: metrics.downloaded_bytes += len(r.content)
+        except requests.RequestException:
+            with metrics.lock: metrics.http_errors["download_all"] += 1
+        metrics.add("download_all", time.perf_counter() - start)
+
+def build_report(args, metrics, wall_sec, mock_behavior):
+    total_receipts = args.users * args.receipts
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        "wall_sec": round(wall_sec, 2),
+        "throughput": {
+            "receipts_per_sec": round(metrics.records / wall_sec, 3) if wall_sec else 0,
+            "uploads_per_min": round(args.users / wall_sec * 60, 2) if wall_sec else 0,
+        },
+        "latency": {k: percentiles(v) for k, v in metrics.latency.items()},
+        "errors": {
+            "http_error_rate": {k: round(metrics.http_errors[k] / n, 4) if n else 0
+                                for k, n in metrics.requests.items()},
+            "missing_records": total_receipts - metrics.records,
+            "error_record_rate": round(metrics.error_records / metrics.records, 4) if metrics.records else 0,
+            "tax_type_error_rate": round(metrics.tax_errors / metrics.records, 4) if metrics.records else 0,
+        },
+        # 0 이 아니면 처리량/지연 시간에 OCR 을 건너뛴 레코드가 섞여 있다.
+        "duplicate_records": metrics.duplicates,
+        "downloaded_mb": round(metrics.downloaded_bytes / (1024 * 1024), 2),
+        "nts_mock": mock_behavior.stats if mock_behavior else None,
+    }
+
+def print_comparison(report, prev):
+    # 주요 지표만 이전 실행과 비교
+    rows = [("receipts/s", ["throughput", "receipts_per_sec"]),
+            ("upload p95 ms", ["latency", "upload", "p95_ms"]),
+            ("first line p50 ms", ["latency", "first_line", "p50_ms"]),
+            ("first line p95 ms", ["latency", "first_line", "p95_ms"]),
+            ("retry_tax p95 ms", ["latency", "retry_tax", "p95_ms"]),
+            ("download p95 ms", ["latency", "download_all", "p95_ms"]),
+            ("error record rate", ["errors", "error_record_rate"]),
+            ("tax error rate", ["errors", "tax_type_error_rate"]),
+            ("duplicate records", ["duplicate_records"])]
+    def get(d, keys):
+        for k in keys:
+            if not isinstance(d, dict) or k not in d:
+                return None
+            d = d[k]
+        return d
+    print(f"\n{'metric':<20}{'prev':>12}{'now':>12}")
+    for name, keys in rows:
+        print(f"{name:<20}{str(get(prev, keys)):>12}{str(get(report, keys)):>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="영수증 OCR 서버 부하 테스트")
+    parser.add_argument("--users", type=int, default=4, help="동시 사용자 수 (N)")
+    parser.add_argument("--receipts", type=int, default=10, help="사용자당 업로드 영수증 수 (M)")
+    parser.add_argument("--images", default=None, help="업로드할 영수증 폴더 (없으면 합성 이미지 생성)")
+    parser.add_argument("--retry_tax", type=int, default=1, help="사용자당 재조회 호출 수")
+    parser.add_argument("--download", type=int, default=2, choices=[0, 1, 2], help="0: 없음, 1: origin, 2: origin+vis")
+    parser.add_argument("--server", default=None, help="이미 떠 있는 서버 주소 (없으면 직접 실행)")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--mock_port", type=int, default=19100)
+    parser.add_argument("--mock_latency_ms", type=float, default=100)
+    parser.add_argument("--mock_jitter_ms", type=float, default=50)
+    parser.add_argument("--mock_error_rate", type=float, default=0.0)
+    parser.add_argument("--mock_max_batch", type=int, default=100)
+    parser.add_argument("--mock_rps_limit", type=int, default=0)
+    parser.add_argument("--no_warmup", action="store_true", help="OCR 모델 로드용 사전 업로드 생략")
+    parser.add_argument("--dedup", action="store_true", help="중복 영수증 검출을 켠 채로 측정 (기본은 끔)")
+    parser.add_argument("--timeout", type=float, default=1800)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="비교할 이전 결과 JSON")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="loadtest_")
+    mock_behavior = None
+    app_proc = None
+    mock_server = None
+    try:
+        if args.images:
+            receipt_paths = sorted(os.path.join(args.images, f) for f in os.listdir(args.images)
+                                   if f.lower().endswith((".jpg", ".png", ".jpeg", ".pdf")))
+        else:
+            os.makedirs(os.path.join(work_dir, "receipts"))
+            receipt_paths = make_synthetic_receipts(os.path.join(work_dir, "receipts"), args.users * args.receipts)
+
+        server = args.server
+        if server is None:
+            mock_behavior = MockBehavior(args.mock_latency_ms, args.mock_jitter_ms, args.mock_error_rate,
+                                         args.mock_max_batch, args.mock_rps_limit)
+            mock_server, _ = start_mock_server(args.mock_port, mock_behavior)
+            app_proc, server = start_app(args.port, f"http://127.0.0.1:{args.mock_port}{STATUS_PATH}", work_dir,
+                                         dedup=args.dedup)
+        print("▶ server:", server, "/ work dir:", work_dir)
+
+        if not args.no_warmup:
+            # 워커마다 OCR 모델을 처음 올리는 시간은 측정에서 제외
+            warm_metrics = Metrics()
+            warm_args = argparse.Namespace(**dict(vars(args), receipts=1, retry_tax=0, download=0))
+            run_user(200, server, receipt_paths, warm_args, warm_metrics)
+            print("▶ warmup done")
+
+        metrics = Metrics()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            futures = [pool.submit(run_user, i, server, receipt_paths, args, metrics) for i in range(args.users)]
+            for f in futures:
+                f.result()
+        wall_sec = time.perf_counter() - start
+
+        report = build_report(args, metrics, wall_sec, mock_behavior)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+        if args.compare:
+            with open(args.compare, "r", encoding="utf-8") as f:
+                print_comparison(report, json.load(f))
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=4)
+            print("✅ saved:", args.out)
+    finally:
+        if app_proc is not None:
+            app_proc.terminate()
+            app_proc.wait()
+        if mock_server is not None:
+            mock_server.shutdown()
+
+if __name__ == "__main__":
+    main()
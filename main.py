@@ -2,51 +2,157 @@ import os
 import re
 import yaml
 import numpy as np
-import shutil
 from datetime import datetime
 from typing import List, Optional
 from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 
-from worker import worker_process_receipt, get_tax_type_from_nts_with_api_call_counter
+from worker import worker_process_receipt, get_tax_type_from_nts_with_api_call_counter, init_worker, reparse_receipt, configure_nts, move_to_result_names
+from ocr_store import get_raw_path, list_raw_ids, load_ocr_raw, update_ocr_meta
 from user_log import get_usage_data
 from receipt_parser_paddle_multi_thread import normalize_tax_type
+from storage_janitor import retire_dir, janitor_loop, storage_stats, mark_batch_start
+from nts_rate_limiter import get_nts_limiter_status, get_key_id
+from task_broker import TaskBroker
+from thumbnail import THUMB_SIZES, get_thumb_etag, get_thumbnail
 
 # Concurrent Processing
-from concurrent.futures import ProcessPoolExecutor
+from worker_pool import ManagedWorkerPool
 import functools
 
 # --- 1. 환경 및 설정 로드 ---
-with open("config.yaml", "r", encoding="utf-8") as f:
+# 부하 테스트 등에서 다른 설정 파일을 쓰려면 RECEIPT_CONFIG 환경변수로 지정
+CONFIG_PATH = os.environ.get("RECEIPT_CONFIG", "config.yaml")
+with open(CONFIG_PATH, "r", encoding="utf-8") as f:
     config = yaml.safe_load(f)
 
 UPLOAD_DIR = config['ocr']['upload_dir']
 RESULT_DIR = config['ocr']['result_dir'] # 이름 변경된 원본 저장
 OCR_VIS_DIR = os.path.join(RESULT_DIR, "vis") # OCR 결과 이미지 저장
+THUMB_DIR = config['ocr'].get('thumb_dir', "thumb") # 결과 목록용 썸네일 캐시
+RAW_DIR = config['ocr'].get('raw_dir', "ocr_raw") # 재파싱용 OCR 원본 결과 (배치가 바뀌어도 유지, 별도 보관 기간 적용)
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULT_DIR, exist_ok=True)
 os.makedirs(OCR_VIS_DIR, exist_ok=True)
+os.makedirs(THUMB_DIR, exist_ok=True)
+os.makedirs(RAW_DIR, exist_ok=True)
+
+# 저장소 정리 설정 (TTL / quota)
+STORAGE_CONF = config.get('storage', {})
+TRASH_DIR = STORAGE_CONF.get('trash_dir', "trash")
+JANITOR_INTERVAL_SEC = STORAGE_CONF.get('janitor_interval_sec', 300)
+STORAGE_TTL_SEC = STORAGE_CONF.get('ttl_hours', 24) * 3600
+USER_QUOTA_BYTES = STORAGE_CONF.get('user_quota_mb', 500) * 1024 * 1024
+GLOBAL_QUOTA_BYTES = STORAGE_CONF.get('global_quota_mb', 10240) * 1024 * 1024
+# OCR 원본 결과는 지난 영수증 재파싱용이라 업로드/결과 TTL 과 quota 정리에서 빼고 따로 보관
+RAW_TTL_SEC = STORAGE_CONF.get('raw_ttl_days', 90) * 86400
+
+# 국세청 API 호출 제한 (웹 프로세스와 워커 프로세스가 같은 버킷을 공유)
+NTS_CONF = config.get('nts', {})
+configure_nts(NTS_CONF)
+
+# 웹 프로세스에서 하는 국세청 조회(분산 모드 결과, 재파싱, 재조회)는 토큰을 max_wait_sec 까지 기다릴 수 있으므로
+# 기본 스레드 풀(브로커 claim/heartbeat/reaper, 썸네일 등)과 분리한다. 재조회는 배치 조회 뒤에 줄 서지 않도록 따로 둔다.
+from concurrent.futures import ThreadPoolExecutor
+nts_executor = ThreadPoolExecutor(max_workers=NTS_CONF.get('lookup_threads', 16), thread_name_prefix="nts_batch")
+nts_interactive_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="nts_interactive")
+
+# 중복 영수증 검출 설정 (워커에 그대로 전달)
+DEDUP_CONF = config.get('dedup', {})
+# 재파싱 결과를 중복 인덱스에도 반영 (재사용되는 이전 결과가 옛 이름/필드를 가리키지 않도록)
+DEDUP_INDEX_DIR = DEDUP_CONF.get('index_dir', "dedup_index") if DEDUP_CONF.get('enabled', True) else None
+
+# 한 장에 찍힌 여러 영수증 분할 설정 (영수증별로 따로 OCR 작업)
+SEGMENT_CONF = config.get('segment', {})
 
 # --- 4. 좌표 오류 해결된 이미지 그리기 ---
 
 # 1. 글로벌 프로세스 풀 생성 (CPU 코어 수에 맞춰 설정)
 # 서버 시작 시 한 번만 생성됩니다.
-executor = ProcessPoolExecutor(max_workers=os.cpu_count() // 2)
-# executor = ProcessPoolExecutor(max_workers=2)
+# 워커가 죽어도 풀 전체가 깨지지 않도록 관리형 풀 사용 (N 작업 / RSS 초과 시 워커 재활용)
+WORKER_CONF = config.get('workers', {})
+executor = ManagedWorkerPool(
+    max_workers=WORKER_CONF.get('max_workers') or os.cpu_count() // 2,
+    max_tasks_per_worker=WORKER_CONF.get('max_tasks_per_worker', 200),
+    rss_limit_bytes=WORKER_CONF.get('rss_limit_mb', 3072) * 1024 * 1024,
+    max_retries=WORKER_CONF.get('max_retries', 1),
+    task_timeout_sec=WORKER_CONF.get('task_timeout_sec', 600),
+    initializer=init_worker,
+    initargs=(config.get('ocr_engine', {"backend": "paddle"}), NTS_CONF),
+)
+
+# 분산 모드: OCR 은 다른 머신의 워커 노드(ocr_worker_node.py)가 수행하고
+# 이 서버는 SQLite 브로커에 작업을 넣고 결과를 모아서 스트리밍하는 코디네이터 역할만 한다.
+DISTRIBUTED_CONF = config.get('distributed', {})
+broker = None
+if DISTRIBUTED_CONF.get('enabled', False):
+    # 토큰이 없으면 포트에 접근 가능한 누구나 작업(업로드 파일)을 가져가고 결과 폴더에 파일을 쓸 수 있다.
+    if not DISTRIBUTED_CONF.get('token'):
+        raise RuntimeError("distributed.enabled 이면 config.yaml 의 distributed.token 을 설정해야 합니다.")
+    # 중복 인덱스는 OCR 하는 쪽의 로컬 파일이라 워커 노드끼리 공유되지 않으므로 분산 모드에서는 사용하지 않는다.
+    if DEDUP_CONF.get('enabled', True):
+        print("distributed.enabled: 중복 영수증 검출(dedup)은 분산 모드에서 사용하지 않습니다.")
+    broker = TaskBroker(DISTRIBUTED_CONF.get('broker_db', "broker/queue.db"),
+                        heartbeat_timeout_sec=DISTRIBUTED_CONF.get('heartbeat_timeout_sec', 30),
+                        max_attempts=DISTRIBUTED_CONF.get('max_attempts', 2),
+                        lease_timeout_sec=DISTRIBUTED_CONF.get('task_lease_sec', 600))
 
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 app.mount("/ocr_result", StaticFiles(directory=RESULT_DIR), name="ocr_result")
 
+# 백그라운드 저장소 정리 작업 시작
+@app.on_event("startup")
+async def start_storage_janitor():
+    import asyncio
+    app.state.janitor_task = asyncio.create_task(
+        janitor_loop([UPLOAD_DIR, RESULT_DIR, OCR_VIS_DIR, THUMB_DIR],
+                     JANITOR_INTERVAL_SEC, STORAGE_TTL_SEC,
+                     USER_QUOTA_BYTES, GLOBAL_QUOTA_BYTES, TRASH_DIR,
+                     retention_dirs={RAW_DIR: RAW_TTL_SEC}))
+
+# 분산 모드: heartbeat 가 끊긴 워커의 작업과 너무 오래 끝나지 않은 작업을 주기적으로 다시 큐에 넣는다.
+@app.on_event("startup")
+async def start_broker_reaper():
+    if broker is None:
+        return
+    import asyncio
+    async def reaper_loop():
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, broker.reap_dead_workers)
+                await loop.run_in_executor(None, broker.reap_expired_tasks)
+            except Exception as e:
+                print("Broker reaper failed : ", e)
+            await asyncio.sleep(DISTRIBUTED_CONF.get('reap_interval_sec', 5))
+    app.state.reaper_task = asyncio.create_task(reaper_loop())
+
 # --- 5. API 엔드포인트 ---
 @app.get("/api/usage")
 async def get_today_usage():
     today = datetime.now().strftime("%Y-%m-%d")
     data = get_usage_data().get(today, {"total": 0})
-    return {"total": data["total"]}
+    # 기본 키의 오늘 호출 수와 남은 일일 한도, 지금 요청 시 예상 대기 시간 (모두 같은 키 기준)
+    # total_all_keys: 사용자 키를 포함한 전체 호출 수
+    service_key = config['ocr']['default_service_key']
+    limiter = get_nts_limiter_status(service_key)
+    return {"total": data.get("keys", {}).get(get_key_id(service_key), 0),
+            "total_all_keys": data["total"],
+            **limiter}
+
+# 저장소 사용량 (janitor 가 마지막으로 측정한 값)
+@app.get("/api/storage")
+async def get_storage_usage():
+    return storage_stats
+
+# 워커 풀 상태 (워커별 처리 건수, RSS, 재활용/크래시 횟수)
+@app.get("/api/workers")
+async def get_worker_status():
+    return executor.worker_info()
 
 # 현재 접속 IP 확인 API
 @app.get("/api/my_ip")
@@ -62,12 +168,15 @@ async def upload_files(request: Request, files: List[UploadFile] = File(...), us
     u_dir = get_user_path(UPLOAD_DIR, request)
     r_dir = get_user_path(RESULT_DIR, request)
     v_dir = get_user_path(OCR_VIS_DIR, request)
+    raw_dir = get_user_path(RAW_DIR, request)
     
+    # 이번 배치의 업로드/결과 파일은 janitor 의 quota 정리 대상에서 제외
+    mark_batch_start(os.path.basename(u_dir))
+
     # 1. 요청 직후 해당 유저의 결과 폴더 초기화 (요구사항 1번)
-    for folder in [r_dir, v_dir]:
-        if os.path.exists(folder):
-            shutil.rmtree(folder)
-        os.makedirs(folder, exist_ok=True)
+    # rmtree 대신 휴지통으로 rename 만 하고, 실제 삭제는 janitor 가 수행
+    for folder in [r_dir, v_dir, get_user_path(THUMB_DIR, request)]:
+        retire_dir(folder, TRASH_DIR)
 
     active_key = user_key if user_key else config['ocr']['default_service_key']
 
@@ -78,28 +187,302 @@ async def upload_files(request: Request, files: List[UploadFile] = File(...), us
         with open(temp_path, "wb") as f: f.write(content)
         file_tasks.append((temp_path, file.filename))
 
+    if broker is not None:
+        return StreamingResponse(broker_event_generator(file_tasks, client_ip, active_key, u_dir, r_dir, v_dir, raw_dir),
+                                 media_type="application/x-ndjson")
+
     import asyncio, json
     async def event_generator():
         loop = asyncio.get_event_loop()
+
+        # 워커가 죽거나 예외가 나도 해당 파일만 오류 레코드로 돌려준다.
+        async def run_task(task, segment_conf=None):
+            try:
+                return await loop.run_in_executor(executor,
+                                                  worker_process_receipt,
+                                                  task,
+                                                  client_ip,
+                                                  active_key,
+                                                  u_dir, r_dir, v_dir,
+                                                  DEDUP_CONF, raw_dir, segment_conf)
+            except Exception as e:
+                print("Failed to parse : ", task[1], e)
+                return {"status": "error",
+                        "message": str(e),
+                        "data": {"original_name": task[1]}}
+
+        # 파일마다 한 작업으로 처리하고, 여러 영수증이 찍힌 파일이면 잘라낸 영수증별로 다시 작업을 만든다.
+        # 결과는 큐에 넣고, 파일 하나가 끝나면 None 을 넣어서 몇 개의 파일이 남았는지 센다.
+        results = asyncio.Queue()
+        async def run_file(task):
+            result = await run_task(task, SEGMENT_CONF)
+            if result.get("status") == "split":
+                parts = result["parts"]
+                async def run_part(k, part):
+                    part_result = await run_task(part)
+                    await results.put(mark_receipt_part(part_result, task[1], k, len(parts)))
+                await asyncio.gather(*[run_part(k, part) for k, part in enumerate(parts, 1)])
+            else:
+                await results.put(result)
+            await results.put(None)
+
         # 병렬 작업을 생성
-        tasks = [
-            loop.run_in_executor(executor,
-                                worker_process_receipt,
-                                task,
-                                client_ip,
-                                active_key,
-                                u_dir, r_dir, v_dir)
-            for task in file_tasks
-        ]
+        running = [asyncio.ensure_future(run_file(task)) for task in file_tasks]
 
         # [핵심] 병렬로 실행하되, 먼저 완료되는 순서대로 뽑아냄
-        for future in asyncio.as_completed(tasks):
-            result = await future
-            # 각 결과가 나올 때마다 JSON 형태로 스트리밍 전송
-            yield json.dumps(result) + "\n"
+        remaining_files = len(file_tasks)
+        try:
+            while remaining_files > 0:
+                result = await results.get()
+                if result is None:
+                    remaining_files -= 1
+                    continue
+                # 각 결과가 나올 때마다 JSON 형태로 스트리밍 전송
+                yield json.dumps(result) + "\n"
+        finally:
+            # 클라이언트가 연결을 끊었으면 아직 풀에서 시작하지 않은 작업은 취소
+            for future in running:
+                future.cancel()
 
     return StreamingResponse(event_generator(), media_type="application/x-ndjson")
 
+# 분할된 영수증이면 어느 파일의 몇 번째 영수증인지 결과에 덧붙인다.
+def mark_receipt_part(result, source_name, part_index, part_count):
+    if part_count > 1:
+        result.setdefault("data", {}).update(source_name=source_name,
+                                             part_index=part_index,
+                                             part_count=part_count)
+    return result
+
+# 분산 모드: 워커 노드는 서비스 키 없이 OCR 만 하고, 국세청 조회는 코디네이터가 결과를 받은 뒤 한다.
+# (서비스 키를 노드에 보내지 않고, 호출 한도/사용량 기록을 코디네이터 한 곳에서 관리)
+# 저장된 OCR 원본 결과로 재파싱하여 과세유형을 채우고 결과 파일 이름을 바꾼다.
+def finish_broker_result(result, client_ip, active_key, r_dir, v_dir, raw_dir):
+    data = result.get("data") or {}
+    if result.get("status") != "success" or not data.get("receipt_id") or not data.get("biz_no"):
+        return result
+    raw_path = get_raw_path(raw_dir, data["receipt_id"])
+    if not os.path.exists(raw_path):
+        return result
+    try:
+        return dict(result, data=reparse_receipt(raw_path, client_ip, active_key, r_dir, v_dir)["data"])
+    except Exception as e:
+        print("Failed to get TaxType for node result : ", data.get("original_name"), e)
+        return result
+
+# 분산 모드: 작업을 브로커에 넣고, 끝나는 순서대로 결과를 스트리밍
+# 여러 영수증이 찍힌 파일은 워커 노드가 잘라서 보내고({"status": "split", "parts": [...]}),
+# 잘라낸 영수증마다 다시 작업을 넣어 여러 노드가 나눠서 처리한다. (로컬 모드와 같은 방식)
+async def broker_event_generator(file_tasks, client_ip, active_key, u_dir, r_dir, v_dir, raw_dir):
+    import asyncio, json, uuid
+    loop = asyncio.get_event_loop()
+    batch_id = uuid.uuid4().hex
+
+    async def enqueue(upload_path, original_name, segment):
+        payload = {"client_ip": client_ip,
+                   "original_name": original_name,
+                   "segment": segment,
+                   # 아래 경로는 코디네이터에서만 사용 (워커 노드에는 보내지 않음)
+                   "upload_path": upload_path,
+                   "result_dir": r_dir, "vis_dir": v_dir, "raw_dir": raw_dir}
+        return await loop.run_in_executor(None, broker.enqueue, batch_id, payload)
+
+    source_names = {}
+    for temp_path, original_filename in file_tasks:
+        task_id = await enqueue(temp_path, original_filename, SEGMENT_CONF.get('enabled', False))
+        source_names[task_id] = original_filename
+
+    # 잘라낸 영수증 작업: task_id -> (원본 파일 이름, 몇 번째, 전체 개수)
+    part_info = {}
+
+    def finish_one(task_id, result):
+        result = finish_broker_result(result, client_ip, active_key, r_dir, v_dir, raw_dir)
+        if task_id in part_info:
+            result = mark_receipt_part(result, *part_info[task_id])
+        return result
+
+    async def finish(task_id, result):
+        return await loop.run_in_executor(nts_executor, finish_one, task_id, result)
+
+    # 끝난 작업마다 국세청 조회를 시작하고, 조회까지 끝난 순서대로 보낸다.
+    remaining = len(source_names)
+    lookups = set()
+    poll_interval_sec = DISTRIBUTED_CONF.get('poll_interval_sec', 0.2)
+    try:
+        while remaining > 0:
+            finished = await loop.run_in_executor(None, broker.pop_finished, batch_id)
+            for task_id, result in finished:
+                if result.get("status") == "split":
+                    # 파일 작업 하나가 영수증별 작업 여러 개로 바뀐다.
+                    parts = result["parts"]
+                    for k, (part_path, part_name) in enumerate(parts, 1):
+                        part_task_id = await enqueue(part_path, part_name, False)
+                        part_info[part_task_id] = (source_names[task_id], k, len(parts))
+                    remaining += len(parts) - 1
+                    continue
+                lookups.add(asyncio.ensure_future(finish(task_id, result)))
+            if not lookups:
+                await asyncio.sleep(poll_interval_sec)
+                continue
+            done, lookups = await asyncio.wait(lookups, timeout=poll_interval_sec)
+            for future in done:
+                remaining -= 1
+                yield json.dumps(future.result()) + "\n"
+    finally:
+        for future in lookups:
+            future.cancel()
+        # 클라이언트가 연결을 끊었으면 남은 작업은 버린다.
+        if remaining > 0:
+            await loop.run_in_executor(None, broker.cancel_batch, batch_id)
+
+# 워커 노드가 보낸 결과 파일 저장
+# 노드의 결과 이름은 노드 임시 폴더 기준이라 여기서 다시 겹치지 않는 이름을 정한다. (예: 과세유형 "오류" 인 같은 영수증 두 장)
+# 이름이 바뀌면 레코드와 OCR 원본 메타도 같이 바꾼다. (이후 국세청 조회/재파싱이 메타의 이름으로 파일을 찾음)
+# 잘라낸 영수증 이미지는 업로드 폴더에 저장하고 result["parts"] 를 [(경로, 이름), ...] 로 바꾼다. (영수증별 작업으로 다시 넣음)
+# 저장한 파일 경로 목록 반환
+def store_node_result_files(result, uploads, payload):
+    r_dir, v_dir, raw_dir = payload["result_dir"], payload["vis_dir"], payload["raw_dir"]
+    stored = []
+    if result.get("status") == "split":
+        part_dir = os.path.join(os.path.dirname(payload["upload_path"]), "parts", payload["original_name"])
+        os.makedirs(part_dir, exist_ok=True)
+        parts = []
+        for name in result.get("parts") or []:
+            content = uploads["part"].get(os.path.basename(name))
+            if content is None:
+                continue
+            part_path = os.path.join(part_dir, os.path.basename(name))
+            os.replace(save_temp_bytes(content, part_dir), part_path)
+            parts.append((part_path, os.path.basename(name)))
+            stored.append(part_path)
+        if not payload.get("segment") or not parts or len(parts) != len(result.get("parts") or []):
+            # 잘라낸 이미지가 빠지면 영수증이 누락되므로 파일 전체를 오류로 돌려준다. (잘라낸 영수증은 다시 자르지 않음)
+            result.clear()
+            result.update(status="error", message="split parts missing",
+                          data={"original_name": payload["original_name"]})
+        else:
+            result["parts"] = parts
+        return stored
+
+    data = result.get("data") or {}
+    origin = uploads["origin"].get(data.get("renamed_name"))
+    vis = uploads["vis"].get(data.get("vis_name"))
+    raw = uploads["raw"].get(f"{data.get('receipt_id')}.npz")
+    if result.get("status") == "success" and origin is not None and vis is not None:
+        tmp_paths = [save_temp_bytes(origin, r_dir), save_temp_bytes(vis, v_dir)]
+        try:
+            renamed_name, vis_name = move_to_result_names(tmp_paths, data, data["tax_type"], data["receipt_id"],
+                                                          r_dir, v_dir)
+        finally:
+            for tmp_path in tmp_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        data.update(renamed_name=renamed_name, vis_name=vis_name)
+        stored += [os.path.join(r_dir, renamed_name), os.path.join(v_dir, vis_name)]
+        if raw is not None:
+            # receipt_id 는 영수증마다 다르므로 덮어쓸 일이 없다.
+            raw_path = get_raw_path(raw_dir, data["receipt_id"])
+            os.replace(save_temp_bytes(raw, raw_dir), raw_path)
+            update_ocr_meta(raw_path, data)
+            stored.append(raw_path)
+    return stored
+
+def save_temp_bytes(content, folder):
+    import tempfile
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=folder)
+    with os.fdopen(fd, "wb") as f: f.write(content)
+    return tmp_path
+
+# --- 분산 워커 노드용 브로커 API ---
+def check_worker_token(request: Request):
+    import hmac
+    token = DISTRIBUTED_CONF.get('token') or ""
+    return broker is not None and bool(token) and \
+        hmac.compare_digest(request.headers.get("X-Worker-Token", ""), token)
+
+@app.post("/api/broker/register")
+async def broker_register(request: Request, host: str = Form(...), pid: int = Form(...)):
+    if not check_worker_token(request):
+        return JSONResponse({"status": "error", "message": "Unauthorized"}, status_code=401)
+    import asyncio
+    worker_id = await asyncio.get_event_loop().run_in_executor(None, broker.register_worker, host, pid)
+    print("Broker: worker registered ", worker_id, host, pid)
+    return {"worker_id": worker_id,
+            "heartbeat_interval_sec": DISTRIBUTED_CONF.get('heartbeat_timeout_sec', 30) / 3}
+
+@app.post("/api/broker/heartbeat")
+async def broker_heartbeat(request: Request, worker_id: str = Form(...)):
+    if not check_worker_token(request):
+        return JSONResponse({"status": "error", "message": "Unauthorized"}, status_code=401)
+    import asyncio
+    alive = await asyncio.get_event_loop().run_in_executor(None, broker.heartbeat, worker_id)
+    if not alive:
+        # 이미 정리된 워커: 다시 등록해야 함
+        return JSONResponse({"status": "error", "message": "Unknown worker"}, status_code=404)
+    return {"status": "success"}
+
+@app.post("/api/broker/claim")
+async def broker_claim(request: Request, worker_id: str = Form(...)):
+    if not check_worker_token(request):
+        return JSONResponse({"status": "error", "message": "Unauthorized"}, status_code=401)
+    import asyncio
+    task = await asyncio.get_event_loop().run_in_executor(None, broker.claim, worker_id)
+    if task is None:
+        return Response(status_code=204)
+    payload = task["payload"]
+    # 서비스 키는 보내지 않는다. (국세청 조회는 코디네이터가 수행)
+    # segment: 업로드한 파일이면 여러 영수증인지 확인, 잘라낸 영수증이면 그대로 OCR
+    return {"task_id": task["task_id"],
+            "client_ip": payload["client_ip"],
+            "original_name": payload["original_name"],
+            "segment": payload.get("segment", False)}
+
+@app.get("/api/broker/file/{task_id}")
+async def broker_file(task_id: str, request: Request):
+    if not check_worker_token(request):
+        return JSONResponse({"status": "error", "message": "Unauthorized"}, status_code=401)
+    import asyncio
+    task = await asyncio.get_event_loop().run_in_executor(None, broker.get_task, task_id)
+    if task is None:
+        return JSONResponse({"status": "error", "message": "No task found"}, status_code=404)
+    import json
+    return FileResponse(json.loads(task["payload"])["upload_path"])
+
+@app.post("/api/broker/complete")
+async def broker_complete(request: Request,
+                          worker_id: str = Form(...), task_id: str = Form(...), result: str = Form(...)):
+    if not check_worker_token(request):
+        return JSONResponse({"status": "error", "message": "Unauthorized"}, status_code=401)
+    import asyncio, json
+    loop = asyncio.get_event_loop()
+    task = await loop.run_in_executor(None, broker.get_task, task_id)
+    if task is None or task["worker_id"] != worker_id or task["status"] != "running":
+        # 이 워커가 죽은 것으로 판단되어 다른 워커에 재할당된 작업
+        return JSONResponse({"status": "error", "message": "Task is not assigned to this worker"}, status_code=409)
+
+    # 결과 파일은 form 필드 이름(origin / vis / raw / part)으로 구분해서 받고, 저장은 스레드 풀에서 한다.
+    payload = json.loads(task["payload"])
+    form = await request.form()
+    uploads = {}
+    for kind in ["origin", "vis", "raw", "part"]:
+        uploads[kind] = {os.path.basename(file.filename): await file.read() for file in form.getlist(kind)}
+    result = json.loads(result)
+    stored = await loop.run_in_executor(None, store_node_result_files, result, uploads, payload)
+
+    accepted = await loop.run_in_executor(None, broker.complete, task_id, worker_id, result)
+    if not accepted:
+        # 파일을 저장하는 사이에 다른 워커로 재할당된 작업: 그 워커의 결과가 쓰이므로 지운다.
+        await loop.run_in_executor(None, lambda: [os.remove(p) for p in stored if os.path.exists(p)])
+    return {"status": "success" if accepted else "ignored"}
+
+# 분산 모드 상태 (작업 상태별 개수, 등록된 워커)
+@app.get("/api/broker/status")
+async def broker_status():
+    if broker is None:
+        return {"enabled": False}
+    import asyncio
+    return {"enabled": True, **await asyncio.get_event_loop().run_in_executor(None, broker.stats)}
+
 # 전체 다운로드 (Zip) 기능 추가
 # Zip 다운로드 시에도 유저 폴더만 압축하도록 수정
 import zipfile
@@ -126,12 +509,83 @@ async def download_all(type: str, request: Request):
     return StreamingResponse(memory_file, media_type="application/zip", 
                              headers={"Content-Disposition": f"attachment; filename=restaurant_receipts_{now_time}_{type}.zip"})
 
+# 저장된 OCR 결과로 정보 추출/파일명 변경만 다시 수행 (OCR 생략)
+# receipt_ids 가 없으면 현재 결과 폴더에 있는 영수증 전체를 다시 파싱한다.
+@app.post("/api/reparse")
+async def reparse(request: Request, receipt_ids: Optional[List[str]] = Form(None), user_key: Optional[str] = Form(None)):
+    client_ip = request.client.host.replace(":", "_")
+    r_dir = get_user_path(RESULT_DIR, request)
+    v_dir = get_user_path(OCR_VIS_DIR, request)
+    raw_dir = get_user_path(RAW_DIR, request)
+    active_key = user_key if user_key else config['ocr']['default_service_key']
+
+    import asyncio, json
+    loop = asyncio.get_event_loop()
+
+    if receipt_ids:
+        ids = [i for i in receipt_ids if re.fullmatch(r"[0-9a-f]{32}", i)]
+    else:
+        # 지난 배치의 OCR 결과는 제외 (결과 파일이 지금 폴더에 있는 것만)
+        def current_ids():
+            ids = []
+            for receipt_id in list_raw_ids(raw_dir):
+                _, meta = load_ocr_raw(get_raw_path(raw_dir, receipt_id))
+                if os.path.exists(os.path.join(r_dir, meta["renamed_name"])):
+                    ids.append(receipt_id)
+            return ids
+        ids = await loop.run_in_executor(None, current_ids)
+
+    async def run_reparse(receipt_id):
+        raw_path = get_raw_path(raw_dir, receipt_id)
+        try:
+            return await loop.run_in_executor(nts_executor, reparse_receipt, raw_path,
+                                              client_ip, active_key, r_dir, v_dir, DEDUP_INDEX_DIR)
+        except Exception as e:
+            print("Failed to reparse : ", receipt_id, e)
+            return {"status": "error",
+                    "message": str(e),
+                    "data": {"receipt_id": receipt_id}}
+
+    async def event_generator():
+        for future in asyncio.as_completed([run_reparse(i) for i in ids]):
+            result = await future
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(event_generator(), media_type="application/x-ndjson")
+
+# 결과 이미지 썸네일 (WebP, 요청 시 생성 후 디스크 캐시)
+# ETag 가 같으면 304 로 응답하여 다시 볼 때는 이미지를 보내지 않는다.
+@app.get("/api/thumb/{type}/{size}/{filename}")
+async def get_thumb(type: str, size: int, filename: str, request: Request):
+    client_ip = request.client.host.replace(":", "_")
+    if type not in ("origin", "vis") or size not in THUMB_SIZES or os.path.basename(filename) != filename:
+        return JSONResponse({"status": "error", "message": "Invalid thumbnail request"}, status_code=400)
+
+    base_folder = RESULT_DIR if type == "origin" else OCR_VIS_DIR
+    src_path = os.path.join(base_folder, client_ip, filename)
+    if not os.path.isfile(src_path):
+        return JSONResponse({"status": "error", "message": "No files found"}, status_code=404)
+
+    etag = get_thumb_etag(src_path, size)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    thumb_dir = os.path.join(THUMB_DIR, client_ip, type, str(size))
+    import asyncio
+    loop = asyncio.get_event_loop()
+    thumb_path = await loop.run_in_executor(None, get_thumbnail, src_path, thumb_dir, size)
+    return FileResponse(thumb_path, media_type="image/webp", headers=headers)
+
 @app.post("/api/retry_tax")
 async def getTaxType(request: Request, biz_no: Optional[str] = Form(None), user_key: Optional[str] = Form(None)):
     client_ip = request.client.host.replace(":", "_")
     
     active_key = user_key if user_key else config['ocr']['default_service_key']
-    tax_type = get_tax_type_from_nts_with_api_call_counter(client_ip, biz_no, active_key)
+    # 재조회는 사용자가 기다리고 있으므로 배치 작업보다 먼저 토큰을 받는다. (대기 중 이벤트 루프를 막지 않도록 스레드에서)
+    import asyncio
+    tax_type = await asyncio.get_event_loop().run_in_executor(
+        nts_interactive_executor, get_tax_type_from_nts_with_api_call_counter, client_ip, biz_no, active_key, "interactive")
     tax_type = normalize_tax_type(tax_type)
 
     if("오류" in tax_type):
@@ -154,12 +608,9 @@ def get_user_path(base_dir, request: Request):
 @app.get("/")
 async def read_index(request: Request):
     client_ip = request.client.host.replace(":", "_")
-    # 해당 유저의 업로드/결과 폴더가 있다면 삭제 후 재생성
-    for base in [UPLOAD_DIR, RESULT_DIR, OCR_VIS_DIR]:
-        user_path = os.path.join(base, client_ip)
-        if os.path.exists(user_path):
-            shutil.rmtree(user_path)
-        os.makedirs(user_path, exist_ok=True)
+    # 해당 유저의 업로드/결과 폴더가 있다면 휴지통으로 옮긴 후 재생성
+    for base in [UPLOAD_DIR, RESULT_DIR, OCR_VIS_DIR, THUMB_DIR]:
+        retire_dir(os.path.join(base, client_ip), TRASH_DIR)
     return FileResponse('static/index.html')
 
 if __name__ == "__main__":
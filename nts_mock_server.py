@@ -0,0 +1,123 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ===============================
+# 국세청 사업자 상태조회 API mock (부하 테스트용)
+# ===============================
+# api.odcloud.kr/api/nts-businessman/v1/status 와 같은 형식으로 응답한다.
+#   python nts_mock_server.py --port 9100 --latency_ms 150 --error_rate 0.05
+# config.yaml 의 nts.api_url 을 http://127.0.0.1:9100/api/nts-businessman/v1/status 로 바꿔서 사용
+# loadtest.py 는 이 서버를 직접 띄운다.
+
+STATUS_PATH = "/api/nts-businessman/v1/status"
+TAX_TYPES = ["부가가치세 일반과세자", "부가가치세 간이과세자", "부가가치세 면세사업자"]
+
+class MockBehavior:
+    def __init__(self, latency_ms=100, jitter_ms=50, error_rate=0.0, max_batch=100, rps_limit=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.max_batch = max_batch      # 한 요청에 넣을 수 있는 사업자번호 수 (실제 API 는 100)
+        self.rps_limit = rps_limit      # 초당 허용 요청 수 (0 이면 제한 없음, 초과 시 429)
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.window_count = 0
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def throttled(self):
+        if not self.rps_limit:
+            return False
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            return self.window_count > self.rps_limit
+
+def get_mock_tax_type(b_no):
+    # 같은 사업자번호는 항상 같은 과세유형
+    return TAX_TYPES[int(hashlib.md5(b_no.encode()).hexdigest(), 16) % len(TAX_TYPES)]
+
+def make_handler(behavior):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, code, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            behavior.count("requests")
+            if urlparse(self.path).path != STATUS_PATH:
+                return self.send_json(404, {"msg": "not found"})
+
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                b_nos = json.loads(self.rfile.read(length)).get("b_no", [])
+            except ValueError:
+                return self.send_json(400, {"status_code": "BAD_JSON_REQUEST"})
+
+            # 지연 시간 (평균 + 균등 분포 흔들림)
+            delay = behavior.latency_ms + random.uniform(-behavior.jitter_ms, behavior.jitter_ms)
+            time.sleep(max(delay, 0) / 1000)
+
+            if behavior.throttled():
+                behavior.count("throttled")
+                return self.send_json(429, {"status_code": "TOO_MANY_REQUESTS"})
+            if random.random() < behavior.error_rate:
+                behavior.count("errors")
+                return self.send_json(500, {"status_code": "INTERNAL_ERROR"})
+            if len(b_nos) > behavior.max_batch:
+                return self.send_json(413, {"status_code": "TOO_LARGE_REQUEST"})
+
+            data = [{"b_no": b, "b_stt": "계속사업자", "b_stt_cd": "01",
+                     "tax_type": get_mock_tax_type(b), "tax_type_cd": "01"} for b in b_nos]
+            self.send_json(200, {"status_code": "OK", "request_cnt": len(b_nos),
+                                 "match_cnt": len(data), "data": data})
+
+    return Handler
+
+def start_mock_server(port, behavior, host="127.0.0.1"):
+    """백그라운드 스레드로 mock 서버 시작, (server, thread) 반환"""
+    server = ThreadingHTTPServer((host, port), make_handler(behavior))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+def main():
+    parser = argparse.ArgumentParser(description="국세청 사업자 상태조회 API mock")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency_ms", type=float, default=100)
+    parser.add_argument("--jitter_ms", type=float, default=50)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--max_batch", type=int, default=100)
+    parser.add_argument("--rps_limit", type=int, default=0)
+    args = parser.parse_args()
+
+    behavior = MockBehavior(args.latency_ms, args.jitter_ms, args.error_rate, args.max_batch, args.rps_limit)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(behavior))
+    print(f"▶ NTS mock: http://{args.host}:{args.port}{STATUS_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(behavior.stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import time
+import uuid
+import sqlite3
+import hashlib
+from datetime import datetime
+from contextlib import contextmanager
+
+# ===============================
+# 국세청 API 호출 제한 (Token Bucket)
+# ===============================
+# 서비스 키마다 초당 호출 수와 일일 호출 한도가 있다.
+# 워커 프로세스들과 웹 프로세스가 같은 SQLite 파일의 버킷을 공유하여
+# 대량 업로드가 한도를 넘겨 나머지 영수증이 모두 "오류" 가 되는 것을 막는다.
+#  - 토큰이 없으면 실패하지 않고 기다린다. (max_wait_sec 까지)
+#  - 재조회 버튼(interactive) 요청이 기다리는 중이면 배치 요청은 양보한다.
+#  - 일일 한도에 도달하면 바로 False (호출하지 않음)
+
+NTS_LIMITER_CONF = {
+    "db_path": "nts_limiter.db",
+    "rate_per_sec": 10,
+    "burst": 10,
+    "daily_quota": 1000,
+    "max_wait_sec": 300,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key_id      TEXT PRIMARY KEY,
+    tokens      REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_usage (
+    key_id      TEXT NOT NULL,
+    day         TEXT NOT NULL,
+    used        INTEGER NOT NULL,
+    PRIMARY KEY (key_id, day)
+);
+CREATE TABLE IF NOT EXISTS waiters (
+    id          TEXT PRIMARY KEY,
+    key_id      TEXT NOT NULL,
+    priority    TEXT NOT NULL,      -- interactive | batch
+    pid         INTEGER,
+    enqueued_at REAL NOT NULL
+);
+"""
+
+_schema_ready = False
+
+def configure_nts_limiter(conf):
+    # 웹 프로세스/워커 프로세스 시작 시 config.yaml 의 nts 설정 반영
+    global _schema_ready
+    if conf:
+        NTS_LIMITER_CONF.update(conf)
+        _schema_ready = False
+
+@contextmanager
+def _connect():
+    # configure 없이 호출되는 경우(CLI 등)에도 기본 설정으로 동작하도록 처음 연결 때 테이블 생성
+    global _schema_ready
+    conn = sqlite3.connect(NTS_LIMITER_CONF["db_path"], timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        if not _schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            _schema_ready = True
+        yield conn
+    finally:
+        conn.close()
+
+def get_key_id(service_key):
+    # 키 원문은 저장하지 않는다.
+    return hashlib.sha1((service_key or "").encode("utf-8")).hexdigest()[:16]
+
+def _refill(conn, key_id, now):
+    rate = NTS_LIMITER_CONF["rate_per_sec"]
+    burst = NTS_LIMITER_CONF["burst"]
+    row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key_id = ?", (key_id,)).fetchone()
+    if row is None:
+        tokens = float(burst)
+        conn.execute("INSERT INTO buckets (key_id, tokens, updated_at) VALUES (?, ?, ?)", (key_id, tokens, now))
+        return tokens
+    tokens = min(float(burst), row["tokens"] + (now - row["updated_at"]) * rate)
+    conn.execute("UPDATE buckets SET tokens = ?, updated_at = ? WHERE key_id = ?", (tokens, now, key_id))
+    return tokens
+
+def _get_used_today(conn, key_id):
+    row = conn.execute("SELECT used FROM daily_usage WHERE key_id = ? AND day = ?",
+                       (key_id, datetime.now().strftime("%Y-%m-%d"))).fetchone()
+    return row["used"] if row else 0
+
+def _interactive_waiting(conn, key_id, now):
+    # 죽은 프로세스가 남긴 대기 항목은 max_wait_sec 이후 무시
+    row = conn.execute("SELECT COUNT(*) AS n FROM waiters WHERE key_id = ? AND priority = 'interactive' "
+                       "AND enqueued_at > ?", (key_id, now - NTS_LIMITER_CONF["max_wait_sec"])).fetchone()
+    return row["n"]
+
+def acquire_nts_token(service_key, priority="batch"):
+    """
+    호출 1회 분의 토큰을 얻는다. 얻으면 True
+    일일 한도 초과 또는 max_wait_sec 동안 못 얻으면 False
+    """
+    key_id = get_key_id(service_key)
+    waiter_id = uuid.uuid4().hex
+    deadline = time.time() + NTS_LIMITER_CONF["max_wait_sec"]
+    rate = NTS_LIMITER_CONF["rate_per_sec"]
+
+    with _connect() as conn:
+        conn.execute("INSERT INTO waiters (id, key_id, priority, pid, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                     (waiter_id, key_id, priority, os.getpid(), time.time()))
+        try:
+            while True:
+                now = time.time()
+                conn.execute("BEGIN IMMEDIATE")
+                tokens = _refill(conn, key_id, now)
+                used = _get_used_today(conn, key_id)
+                if used >= NTS_LIMITER_CONF["daily_quota"]:
+                    conn.execute("COMMIT")
+                    print("NTS daily quota exceeded")
+                    return False
+
+                # 재조회(interactive) 요청이 먼저
+                yield_to_interactive = priority != "interactive" and _interactive_waiting(conn, key_id, now) > 0
+                if tokens >= 1 and not yield_to_interactive:
+                    conn.execute("UPDATE buckets SET tokens = ? WHERE key_id = ?", (tokens - 1, key_id))
+                    conn.execute("INSERT INTO daily_usage (key_id, day, used) VALUES (?, ?, 1) "
+                                 "ON CONFLICT(key_id, day) DO UPDATE SET used = used + 1",
+                                 (key_id, datetime.now().strftime("%Y-%m-%d")))
+                    conn.execute("COMMIT")
+                    return True
+                conn.execute("COMMIT")
+
+                if now > deadline:
+                    print("NTS rate limit wait timeout")
+                    return False
+                time.sleep(max((1 - tokens) / rate, 0.05))
+        finally:
+            conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+
+def get_nts_limiter_status(service_key):
+    """/api/usage 에서 노출: 남은 일일 한도, 대기 중인 요청 수, 예상 대기 시간"""
+    key_id = get_key_id(service_key)
+    rate = NTS_LIMITER_CONF["rate_per_sec"]
+    now = time.time()
+    with _connect() as conn:
+        row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key_id = ?", (key_id,)).fetchone()
+        tokens = NTS_LIMITER_CONF["burst"] if row is None else \
+            min(float(NTS_LIMITER_CONF["burst"]), row["tokens"] + (now - row["updated_at"]) * rate)
+        used = _get_used_today(conn, key_id)
+        waiting = conn.execute("SELECT COUNT(*) AS n FROM waiters WHERE key_id = ? AND enqueued_at > ?",
+                               (key_id, now - NTS_LIMITER_CONF["max_wait_sec"])).fetchone()["n"]
+    remaining = max(NTS_LIMITER_CONF["daily_quota"] - used, 0)
+    return {
+        "daily_quota": NTS_LIMITER_CONF["daily_quota"],
+        "used_today": used,
+        "remaining_quota": remaining,
+        "rate_per_sec": rate,
+        "tokens": round(tokens, 2),
+        "waiting": waiting,
+        # 지금 새로 요청하면 기다려야 하는 시간 (앞선 대기 요청 포함)
+        "expected_wait_sec": round(max(waiting + 1 - tokens, 0) / rate, 2),
+    }
@@ -0,0 +1,230 @@
+import os
+import math
+import cv2
+import numpy as np
+
+# ===============================
+# OCR 엔진 추상화 (Paddle / ONNX Runtime)
+# ===============================
+# 워커는 engine.ocr(img_arr) 만 호출한다. 반환 형식은 PaddleOCR 3.x 와 같게 맞춘다.
+#   [ {"rec_texts": [...], "rec_scores": [...], "dt_polys": [...], "rec_boxes": Nx4} ]
+# 그래서 extract_* 파서 함수와 draw_bb_on_img 를 그대로 쓸 수 있다.
+# config.yaml 의 ocr_engine.backend 로 선택한다.
+
+DEFAULT_ENGINE_CONF = {"backend": "paddle"}
+
+class PaddleOCREngine:
+    def __init__(self, conf):
+        from paddleocr import PaddleOCR
+        self.ocr_engine = PaddleOCR(
+            lang="korean",
+            use_doc_orientation_classify=False,
+            use_textline_orientation=False,
+            # use_angle_cls=False,
+            use_doc_unwarping=False,
+        )
+
+    def ocr(self, img_arr):
+        return self.ocr_engine.ocr(img_arr)
+
+class OnnxOCREngine:
+    """
+    PP-OCRv5 det(DB) + rec(CTC) 모델을 ONNX Runtime 으로 실행
+    모델 변환/양자화는 convert_ocr_onnx.py 참고
+    입력 배열은 Paddle 백엔드와 같은 배열을 채널 변환 없이 그대로 사용한다. (두 백엔드 결과 비교를 위함)
+    """
+    # PaddleX PP-OCRv5 det 기본값
+    DET_LIMIT_SIDE_LEN = 64
+    DET_MAX_SIDE_LIMIT = 4000
+    DET_THRESH = 0.3
+    DET_BOX_THRESH = 0.6
+    DET_UNCLIP_RATIO = 1.5
+    DET_MAX_CANDIDATES = 1000
+    DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+    REC_IMG_H = 48
+    REC_IMG_W = 320
+    REC_BATCH = 6
+
+    def __init__(self, conf):
+        import onnxruntime as ort
+        onnx_conf = conf.get("onnx", {})
+
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.intra_op_num_threads = onnx_conf.get("intra_op_threads", int(os.environ.get("OMP_NUM_THREADS", "4")))
+        so.inter_op_num_threads = 1
+        providers = ["CPUExecutionProvider"]
+
+        self.det_sess = ort.InferenceSession(onnx_conf["det_model"], sess_options=so, providers=providers)
+        self.rec_sess = ort.InferenceSession(onnx_conf["rec_model"], sess_options=so, providers=providers)
+        self.det_input = self.det_sess.get_inputs()[0].name
+        self.rec_input = self.rec_sess.get_inputs()[0].name
+
+        # CTC 문자 사전: 0 번은 blank, 마지막은 공백
+        with open(onnx_conf["rec_dict"], "r", encoding="utf-8") as f:
+            chars = [line.rstrip("\r\n") for line in f]
+        self.characters = ["blank"] + chars + [" "]
+
+    # --- 1. 텍스트 영역 검출 ---
+    def _det_resize(self, img):
+        h, w = img.shape[:2]
+        ratio = 1.0
+        if min(h, w) < self.DET_LIMIT_SIDE_LEN:
+            ratio = self.DET_LIMIT_SIDE_LEN / min(h, w)
+        if max(h, w) * ratio > self.DET_MAX_SIDE_LIMIT:
+            ratio = self.DET_MAX_SIDE_LIMIT / max(h, w)
+        resize_h = max(int(round(h * ratio / 32) * 32), 32)
+        resize_w = max(int(round(w * ratio / 32) * 32), 32)
+        resized = cv2.resize(img, (resize_w, resize_h))
+        return resized, resize_h / h, resize_w / w
+
+    def _box_score(self, pred, box):
+        h, w = pred.shape
+        xmin = int(np.clip(np.floor(box[:, 0].min()), 0, w - 1))
+        xmax = int(np.clip(np.ceil(box[:, 0].max()), 0, w - 1))
+        ymin = int(np.clip(np.floor(box[:, 1].min()), 0, h - 1))
+        ymax = int(np.clip(np.ceil(box[:, 1].max()), 0, h - 1))
+        mask = np.zeros((ymax - ymin + 1, xmax - xmin + 1), dtype=np.uint8)
+        shifted = box.copy()
+        shifted[:, 0] -= xmin
+        shifted[:, 1] -= ymin
+        cv2.fillPoly(mask, shifted.reshape(1, -1, 2).astype(np.int32), 1)
+        return cv2.mean(pred[ymin:ymax + 1, xmin:xmax + 1], mask)[0]
+
+    @staticmethod
+    def _order_points(pts):
+        # 좌상, 우상, 우하, 좌하 순서
+        pts = sorted(pts.tolist(), key=lambda p: p[0])
+        left = sorted(pts[:2], key=lambda p: p[1])
+        right = sorted(pts[2:], key=lambda p: p[1])
+        return np.array([left[0], right[0], right[1], left[1]], dtype=np.float32)
+
+    def _unclip(self, box):
+        # 사각형을 면적*ratio/둘레 만큼 사방으로 넓힌다. (pyclipper offset 과 같은 효과)
+        area = cv2.contourArea(box)
+        length = cv2.arcLength(box, True)
+        if length == 0:
+            return box
+        distance = area * self.DET_UNCLIP_RATIO / length
+        (cx, cy), (bw, bh), angle = cv2.minAreaRect(box)
+        return cv2.boxPoints(((cx, cy), (bw + 2 * distance, bh + 2 * distance), angle))
+
+    def detect(self, img_arr):
+        h, w = img_arr.shape[:2]
+        resized, ratio_h, ratio_w = self._det_resize(img_arr)
+        x = (resized.astype(np.float32) / 255.0 - self.DET_MEAN) / self.DET_STD
+        x = x.transpose(2, 0, 1)[np.newaxis, :]
+        pred = self.det_sess.run(None, {self.det_input: x})[0][0, 0]
+
+        bitmap = (pred > self.DET_THRESH).astype(np.uint8)
+        contours, _ = cv2.findContours(bitmap, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = []
+        for contour in contours[:self.DET_MAX_CANDIDATES]:
+            rect = cv2.minAreaRect(contour)
+            if min(rect[1]) < 3:
+                continue
+            box = cv2.boxPoints(rect)
+            if self._box_score(pred, box) < self.DET_BOX_THRESH:
+                continue
+            box = self._unclip(box)
+            if min(cv2.minAreaRect(box)[1]) < 5:
+                continue
+            box = self._order_points(box)
+            box[:, 0] = np.clip(np.round(box[:, 0] / ratio_w), 0, w)
+            box[:, 1] = np.clip(np.round(box[:, 1] / ratio_h), 0, h)
+            if np.linalg.norm(box[0] - box[1]) <= 3 or np.linalg.norm(box[0] - box[3]) <= 3:
+                continue
+            boxes.append(box.astype(np.int32))
+
+        # 위에서 아래, 왼쪽에서 오른쪽 순서로 정렬 (같은 줄은 y 차이 10px 이내)
+        boxes.sort(key=lambda b: (b[0][1], b[0][0]))
+        for i in range(len(boxes) - 1):
+            for j in range(i, -1, -1):
+                if abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10 and boxes[j + 1][0][0] < boxes[j][0][0]:
+                    boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+                else:
+                    break
+        return boxes
+
+    # --- 2. 텍스트 인식 ---
+    @staticmethod
+    def _crop(img_arr, box):
+        pts = box.astype(np.float32)
+        crop_w = int(max(np.linalg.norm(pts[0] - pts[1]), np.linalg.norm(pts[2] - pts[3])))
+        crop_h = int(max(np.linalg.norm(pts[0] - pts[3]), np.linalg.norm(pts[1] - pts[2])))
+        dst = np.float32([[0, 0], [crop_w, 0], [crop_w, crop_h], [0, crop_h]])
+        M = cv2.getPerspectiveTransform(pts, dst)
+        crop = cv2.warpPerspective(img_arr, M, (crop_w, crop_h),
+                                   borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+        if crop.shape[0] / max(crop.shape[1], 1) >= 1.5:
+            crop = np.ascontiguousarray(np.rot90(crop))
+        return crop
+
+    def _rec_batch(self, crops):
+        max_wh_ratio = max(self.REC_IMG_W / self.REC_IMG_H,
+                           *(c.shape[1] / max(c.shape[0], 1) for c in crops))
+        batch_w = int(self.REC_IMG_H * max_wh_ratio)
+        batch = np.zeros((len(crops), 3, self.REC_IMG_H, batch_w), dtype=np.float32)
+        for i, crop in enumerate(crops):
+            h, w = crop.shape[:2]
+            resized_w = min(batch_w, int(math.ceil(self.REC_IMG_H * w / max(h, 1))))
+            resized = cv2.resize(crop, (max(resized_w, 1), self.REC_IMG_H)).astype(np.float32)
+            resized = (resized / 255.0 - 0.5) / 0.5
+            batch[i, :, :, :resized.shape[1]] = resized.transpose(2, 0, 1)
+        probs = self.rec_sess.run(None, {self.rec_input: batch})[0]
+        return [self._ctc_decode(p) for p in probs]
+
+    def _ctc_decode(self, prob):
+        idx = prob.argmax(axis=1)
+        conf = prob.max(axis=1)
+        keep = np.ones(len(idx), dtype=bool)
+        keep[1:] = idx[1:] != idx[:-1]
+        keep &= idx != 0
+        text = "".join(self.characters[i] for i in idx[keep] if i < len(self.characters))
+        score = float(conf[keep].mean()) if keep.any() else 0.0
+        return text, score
+
+    def recognize(self, img_arr, boxes):
+        crops = [self._crop(img_arr, b) for b in boxes]
+        # 가로세로 비율이 비슷한 것끼리 묶어서 패딩 낭비를 줄인다.
+        order = np.argsort([c.shape[1] / max(c.shape[0], 1) for c in crops])
+        results = [None] * len(crops)
+        for start in range(0, len(order), self.REC_BATCH):
+            idxs = order[start:start + self.REC_BATCH]
+            for i, res in zip(idxs, self._rec_batch([crops[i] for i in idxs])):
+                results[i] = res
+        return results
+
+    def ocr(self, img_arr):
+        boxes = self.detect(img_arr)
+        recs = self.recognize(img_arr, boxes) if boxes else []
+
+        texts, scores, polys, rects = [], [], [], []
+        for box, (text, score) in zip(boxes, recs):
+            if not text:
+                continue
+            texts.append(text)
+            scores.append(score)
+            polys.append(box)
+            rects.append([box[:, 0].min(), box[:, 1].min(), box[:, 0].max(), box[:, 1].max()])
+        return [{
+            "rec_texts": texts,
+            "rec_scores": scores,
+            "dt_polys": polys,
+            "rec_boxes": np.array(rects, dtype=np.int32).reshape(-1, 4),
+        }]
+
+OCR_BACKENDS = {
+    "paddle": PaddleOCREngine,
+    "onnx": OnnxOCREngine,
+}
+
+def create_ocr_engine(conf=None):
+    conf = conf or DEFAULT_ENGINE_CONF
+    backend = conf.get("backend", "paddle")
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"지원하지 않는 OCR backend: {backend}")
+    print("Init OCR engine: ", backend)
+    return OCR_BACKENDS[backend](conf)
@@ -0,0 +1,55 @@
+import os
+import json
+import numpy as np
+
+# ===============================
+# OCR 원본 결과 저장 (재파싱용)
+# ===============================
+# 파싱 규칙이 바뀌어도 OCR 을 다시 돌리지 않도록, 영수증마다 OCR 결과를
+# 열(column) 단위 압축 npz 로 저장한다. (numpy 만 사용, 추가 의존성 없음)
+#   rec_texts  : 문자열 배열
+#   rec_scores : float32 (N,)
+#   dt_polys   : int32 (N, 4, 2)
+#   rec_boxes  : int32 (N, 4)
+#   meta       : JSON 문자열 (원본 파일명, 현재 결과 파일명, 사업자번호, 과세유형 등)
+# 파일 이름은 receipt_id 이며, 결과 파일 이름이 바뀌어도 그대로 유지된다.
+
+def get_raw_path(raw_dir, receipt_id):
+    return os.path.join(raw_dir, f"{receipt_id}.npz")
+
+def save_ocr_raw(raw_path, ocr_res, meta):
+    texts = list(ocr_res["rec_texts"])
+    polys = [np.asarray(p, dtype=np.int32).reshape(-1, 2)[:4] for p in ocr_res["dt_polys"]]
+    tmp_path = raw_path + ".tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        rec_texts=np.array(texts, dtype=str),
+        rec_scores=np.asarray(ocr_res["rec_scores"], dtype=np.float32).reshape(-1),
+        dt_polys=np.array(polys, dtype=np.int32).reshape(-1, 4, 2),
+        rec_boxes=np.asarray(ocr_res["rec_boxes"], dtype=np.int32).reshape(-1, 4),
+        meta=np.array(json.dumps(meta, ensure_ascii=False)),
+    )
+    os.replace(tmp_path, raw_path)
+    return raw_path
+
+def load_ocr_raw(raw_path):
+    """(ocr_res, meta) 반환. ocr_res 는 PaddleOCR 결과와 같은 키를 가진 dict"""
+    with np.load(raw_path, allow_pickle=False) as data:
+        ocr_res = {
+            "rec_texts": data["rec_texts"].tolist(),
+            "rec_scores": data["rec_scores"].tolist(),
+            "dt_polys": list(data["dt_polys"]),
+            "rec_boxes": data["rec_boxes"],
+        }
+        meta = json.loads(str(data["meta"]))
+    return ocr_res, meta
+
+def update_ocr_meta(raw_path, meta):
+    # 메타데이터만 바꿔서 다시 저장 (OCR 결과는 그대로)
+    ocr_res, _ = load_ocr_raw(raw_path)
+    return save_ocr_raw(raw_path, ocr_res, meta)
+
+def list_raw_ids(raw_dir):
+    if not os.path.exists(raw_dir): return []
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(raw_dir)
+                  if f.endswith(".npz") and not f.endswith(".tmp.npz"))
@@ -0,0 +1,186 @@
+import os
+import time
+import json
+import socket
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import requests
+import yaml
+
+from worker import worker_process_receipt, init_worker
+
+# ===============================
+# 분산 OCR 워커 노드
+# ===============================
+# config.yaml 의 distributed.enabled 를 켠 코디네이터(main.py)에서 작업을 가져와 OCR 후 결과를 돌려준다.
+# 다른 머신에서 실행하거나, 한 머신에서 여러 개를 띄워 scale-out 을 시험할 수 있다.
+#   python ocr_worker_node.py --server http://127.0.0.1:8080 --processes 3
+# 노드가 죽으면 heartbeat 가 끊기고, 코디네이터가 그 작업을 다른 노드에 다시 할당한다.
+# 노드는 살아 있는데 작업을 놓친 경우(결과 전송 실패 등)는 코디네이터의 작업 lease(task_lease_sec) 만료로 재할당된다.
+# 노드는 국세청 조회를 하지 않는다. (과세유형 "오류" 로 결과를 보내면 코디네이터가 조회 후 이름 변경)
+# 서비스 키가 노드로 가지 않고, 일일 호출 한도/사용량 기록도 코디네이터 한 곳에서 관리된다.
+# (중복 영수증 인덱스는 코디네이터 로컬 파일이므로 분산 모드에서는 사용하지 않는다.)
+
+class NodeSession:
+    def __init__(self, server, token):
+        self.server = server.rstrip("/")
+        self.http = requests.Session()
+        if token:
+            self.http.headers["X-Worker-Token"] = token
+        self.worker_id = None
+        self.heartbeat_interval_sec = 10
+        self.lock = threading.Lock()
+
+    def post(self, path, **kwargs):
+        return self.http.post(self.server + path, timeout=60, **kwargs)
+
+    def register(self):
+        r = self.post("/api/broker/register", data={"host": socket.gethostname(), "pid": os.getpid()})
+        r.raise_for_status()
+        info = r.json()
+        with self.lock:
+            self.worker_id = info["worker_id"]
+            self.heartbeat_interval_sec = info.get("heartbeat_interval_sec", 10)
+        print(f"[node {os.getpid()}] registered as {self.worker_id}")
+
+    def heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval_sec)
+            try:
+                r = self.post("/api/broker/heartbeat", data={"worker_id": self.worker_id})
+                if r.status_code == 404:
+                    # 코디네이터가 이 노드를 죽은 것으로 처리함: 다시 등록
+                    self.register()
+            except requests.RequestException as e:
+                print(f"[node {os.getpid()}] heartbeat failed : ", e)
+
+def run_receipt(file_info, client_ip, dirs, segment_conf=None):
+    try:
+        return worker_process_receipt(file_info, client_ip, None,
+                                      dirs["upload"], dirs["origin"], dirs["vis"],
+                                      None, dirs["raw"], segment_conf)
+    except Exception as e:
+        print("Failed to parse : ", file_info[1], e)
+        return {"status": "error",
+                "message": str(e),
+                "data": {"original_name": file_info[1]}}
+
+def process_task(node, task, segment_conf=None):
+    original_name = os.path.basename(task["original_name"])
+    with tempfile.TemporaryDirectory(prefix="ocr_node_") as tmp:
+        dirs = {k: os.path.join(tmp, k) for k in ["upload", "origin", "vis", "raw"]}
+        for d in dirs.values():
+            os.makedirs(d)
+
+        # 1. 원본 파일 받기 (실패하면 오류 결과를 보내서 코디네이터가 기다리지 않게 한다)
+        try:
+            r = node.http.get(f"{node.server}/api/broker/file/{task['task_id']}", timeout=60)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            print(f"[node {os.getpid()}] file download failed : ", original_name, e)
+            post_complete(node, task, {"status": "error",
+                                       "message": f"file download failed: {e}",
+                                       "data": {"original_name": original_name}})
+            return
+        temp_path = os.path.join(dirs["upload"], original_name)
+        with open(temp_path, "wb") as f: f.write(r.content)
+
+        # 2. 로컬에서 OCR (웹 서버의 워커와 같은 함수, 서비스 키 없이 -> 국세청 조회 생략)
+        # 여러 영수증이 찍힌 파일이면 잘라낸 이미지만 보내고, 코디네이터가 영수증별 작업으로 다시 나눠준다.
+        result = run_receipt((temp_path, original_name), task["client_ip"], dirs,
+                             segment_conf if task.get("segment") else None)
+        files = []
+        if result.get("status") == "split":
+            files = [("part", (name, open(part_path, "rb"))) for part_path, name in result["parts"]]
+            result = {"status": "split", "parts": [name for _, name in result["parts"]]}
+
+        # 3. 결과 레코드 + 결과 파일 업로드
+        for kind in ["origin", "vis", "raw"]:
+            for name in os.listdir(dirs[kind]):
+                files.append((kind, (name, open(os.path.join(dirs[kind], name), "rb"))))
+        try:
+            post_complete(node, task, result, files)
+        finally:
+            for _, (_, fp) in files:
+                fp.close()
+
+# 결과 전송은 몇 번 재시도한다. (끝내 실패하면 코디네이터의 작업 lease 가 만료되어 다시 할당됨)
+def post_complete(node, task, result, files=(), retries=3):
+    data = {"worker_id": node.worker_id, "task_id": task["task_id"],
+            "result": json.dumps(result, ensure_ascii=False)}
+    for attempt in range(retries):
+        try:
+            for _, (_, fp) in files:
+                fp.seek(0)
+            r = node.post("/api/broker/complete", data=data, files=list(files))
+            if r.status_code == 409:
+                print(f"[node {os.getpid()}] task reassigned, result dropped : ", task["original_name"])
+                return False
+            if r.status_code < 500:
+                r.raise_for_status()
+                return True
+            print(f"[node {os.getpid()}] complete failed ({r.status_code}) : ", task["original_name"])
+        except requests.RequestException as e:
+            print(f"[node {os.getpid()}] complete failed : ", task["original_name"], e)
+        time.sleep(2 ** attempt)
+    return False
+
+def run_node(server, token, ocr_engine_conf, segment_conf, poll_interval_sec):
+    init_worker(ocr_engine_conf)
+    node = NodeSession(server, token)
+    while True:
+        try:
+            node.register()
+            break
+        except requests.RequestException as e:
+            print(f"[node {os.getpid()}] waiting for coordinator : ", e)
+            time.sleep(3)
+    threading.Thread(target=node.heartbeat_loop, daemon=True).start()
+
+    while True:
+        try:
+            r = node.post("/api/broker/claim", data={"worker_id": node.worker_id})
+            if r.status_code == 204:
+                time.sleep(poll_interval_sec)
+                continue
+            r.raise_for_status()
+            process_task(node, r.json(), segment_conf)
+        except requests.RequestException as e:
+            print(f"[node {os.getpid()}] request failed : ", e)
+            time.sleep(3)
+        except Exception as e:
+            # 노드 프로세스는 계속 돈다. (이 작업은 코디네이터의 lease 만료 후 다시 할당됨)
+            print(f"[node {os.getpid()}] task failed : ", e)
+            time.sleep(3)
+
+def main():
+    parser = argparse.ArgumentParser(description="분산 OCR 워커 노드")
+    parser.add_argument("--server", required=True, help="코디네이터 주소 (예: http://10.0.0.5:8080)")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--token", default=None, help="없으면 config.yaml 의 distributed.token")
+    parser.add_argument("--processes", type=int, default=1, help="이 머신에서 띄울 워커 수")
+    parser.add_argument("--poll_interval_sec", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    token = args.token or config.get("distributed", {}).get("token")
+    ocr_engine_conf = config.get("ocr_engine", {"backend": "paddle"})
+    segment_conf = config.get("segment", {})
+
+    procs = [multiprocessing.Process(target=run_node,
+                                     args=(args.server, token, ocr_engine_conf, segment_conf, args.poll_interval_sec))
+             for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import cv2
+import hashlib
+import numpy as np
+
+# ===============================
+# 중복 영수증 검출 (Perceptual Hash)
+# ===============================
+# 같은 영수증을 두 번 찍거나, 사진과 PDF 로 같이 올리는 경우가 많다.
+#  - 픽셀이 완전히 같은 재업로드(content_hash 일치)만 OCR/국세청 조회 없이 이전 결과를 재사용한다.
+#  - dHash 가 가까운 영수증은 "후보" 일 뿐이다. 같은 가게(같은 POS 양식)의 다른 날 영수증은
+#    금액/날짜 숫자만 달라서 dHash 로는 구분되지 않는다. (16x16 에서 거리 2 이하도 나옴)
+#    그래서 OCR 은 그대로 하고, 읽은 주요 필드(사업자번호/날짜/금액/승인번호)가 후보와 모두 같을 때만
+#    같은 영수증을 다시 찍은 것으로 보고 국세청 조회만 생략한다. (same_receipt_fields)
+# 인덱스는 IP 별 JSON 파일이며, 여러 워커 프로세스가 같이 쓰므로 lock 파일로 보호한다.
+
+DEDUP_INDEX_DIR = "dedup_index"
+HASH_SIZE = 16
+HAMMING_THRESHOLD = 16    # 256bit 전체 해시 중 이 개수 이하로 다르고
+REGION_THRESHOLD = 12     # 아래쪽 절반 해시도 이 개수 이하로 다르면 후보 (필드 확인 전에는 중복 아님)
+# 후보가 같은 영수증인지 확인하는 필드 (하나라도 못 읽었으면 같은 영수증으로 보지 않는다)
+KEY_FIELDS = ["biz_no", "pay_date", "amount", "approval_no"]
+INDEX_TTL_SEC = 24 * 3600
+PENDING_TIMEOUT_SEC = 120 # 같은 배치의 다른 워커가 OCR 중인 경우 기다리는 최대 시간
+LOCK_STALE_SEC = 10
+
+def dhash(img_arr, hash_size=HASH_SIZE):
+    """
+    difference hash: 회색조로 (hash_size+1) x hash_size 로 줄인 후
+    가로로 이웃한 픽셀의 밝기 차이를 비트로 만든다. 16자리 hex 문자열 반환
+    """
+    if img_arr.ndim == 3:
+        gray = cv2.cvtColor(img_arr, cv2.COLOR_RGB2GRAY)
+    else:
+        gray = img_arr
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    diff = small[:, 1:] > small[:, :-1]
+    value = 0
+    for bit in diff.flatten():
+        value = (value << 1) | int(bit)
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+def hamming_distance(hash_a, hash_b):
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+def image_hashes(img_arr):
+    """인덱스 비교용 해시 묶음: 전체 dHash, 아래쪽 절반 dHash, 픽셀 내용 해시"""
+    h = img_arr.shape[0]
+    return {"hash": dhash(img_arr),
+            "region_hash": dhash(img_arr[h // 2:]),
+            "content_hash": hashlib.sha1(np.ascontiguousarray(img_arr).tobytes()).hexdigest()}
+
+# --- 인덱스 파일 lock ---
+def _acquire_lock(lock_path):
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            return
+        except FileExistsError:
+            # 죽은 프로세스가 남긴 lock 은 일정 시간 후 무시
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SEC:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                pass
+            time.sleep(0.05)
+
+def _release_lock(lock_path):
+    try:
+        os.remove(lock_path)
+    except OSError:
+        pass
+
+def _index_paths(client_ip, index_dir):
+    os.makedirs(index_dir, exist_ok=True)
+    name = client_ip.replace(":", "_")
+    return os.path.join(index_dir, f"{name}.json"), os.path.join(index_dir, f"{name}.lock")
+
+def _load_index(index_path):
+    if not os.path.exists(index_path): return []
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return []
+
+def _save_index(index_path, entries):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+def _pid_alive(pid):
+    # Windows 의 os.kill 은 프로세스를 종료시키므로 확인하지 않는다.
+    if pid is None or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+def _find_exact(entries, hashes):
+    # 픽셀까지 같은 영수증 (처리 중인 항목 포함)
+    for entry in entries:
+        if entry.get("content_hash") == hashes["content_hash"]:
+            return entry
+    return None
+
+def _find_candidate(entries, hashes, threshold, region_threshold):
+    # 모양이 비슷한 완료 항목 중 가장 가까운 것 (OCR 후 same_receipt_fields 로 확인할 후보)
+    best = None
+    for entry in entries:
+        # 예전 형식(64bit 해시만 있는 항목)은 비교하지 않는다.
+        if entry["status"] != "done" or "region_hash" not in entry or len(entry["hash"]) != len(hashes["hash"]):
+            continue
+        dist = hamming_distance(entry["hash"], hashes["hash"])
+        if dist > threshold or hamming_distance(entry["region_hash"], hashes["region_hash"]) > region_threshold:
+            continue
+        if best is None or dist < best[0]:
+            best = (dist, entry)
+    return best[1] if best else None
+
+def same_receipt_fields(fields, data):
+    """OCR 로 읽은 주요 필드가 모두 있고 후보 결과와 같으면 True"""
+    return all(fields.get(k) and fields.get(k) == data.get(k) for k in KEY_FIELDS)
+
+def claim_or_match(client_ip, hashes, index_dir=DEDUP_INDEX_DIR,
+                   threshold=HAMMING_THRESHOLD, ttl_sec=INDEX_TTL_SEC, region_threshold=REGION_THRESHOLD):
+    """
+    인덱스에서 같은 영수증을 찾는다. (hashes = image_hashes(img_arr))  (match, candidate) 반환
+    - 픽셀이 같은 완료 항목이 있으면 (그 결과(data), None)
+    - 픽셀이 같은 항목을 다른 워커가 처리 중(pending)이면 끝날 때까지 기다렸다가 반환
+    - 없으면 pending 항목을 등록하고 (None, 모양이 비슷한 완료 항목의 data 또는 None)
+      (호출자가 OCR 후 complete_entry 호출)
+    """
+    index_path, lock_path = _index_paths(client_ip, index_dir)
+    deadline = time.time() + PENDING_TIMEOUT_SEC
+    while True:
+        _acquire_lock(lock_path)
+        try:
+            now = time.time()
+            # TTL 지난 항목과, OCR 도중 죽은 워커가 남긴 pending 항목은 버린다.
+            entries = [e for e in _load_index(index_path)
+                       if now - e["time"] < ttl_sec
+                       and (e["status"] != "pending" or _pid_alive(e.get("pid")))]
+            match = _find_exact(entries, hashes)
+            if match is None or (match["status"] == "pending" and now > deadline):
+                candidate = _find_candidate(entries, hashes, threshold, region_threshold)
+                entries.append(dict(hashes, time=now, status="pending", pid=os.getpid(), data=None))
+                _save_index(index_path, entries)
+                return None, candidate["data"] if candidate else None
+            if match["status"] == "done":
+                return match["data"], None
+        finally:
+            _release_lock(lock_path)
+        time.sleep(0.5)
+
+def complete_entry(client_ip, content_hash, data, index_dir=DEDUP_INDEX_DIR):
+    """OCR 이 끝난 항목의 결과를 기록한다. data 가 None 이면 (실패) 항목을 제거한다."""
+    index_path, lock_path = _index_paths(client_ip, index_dir)
+    _acquire_lock(lock_path)
+    try:
+        entries = _load_index(index_path)
+        for entry in entries:
+            if entry.get("content_hash") == content_hash and entry["status"] == "pending":
+                if data is None:
+                    entries.remove(entry)
+                else:
+                    entry["status"] = "done"
+                    entry["data"] = data
+                    entry["time"] = time.time()
+                break
+        _save_index(index_path, entries)
+    finally:
+        _release_lock(lock_path)
+
+def update_entry(client_ip, receipt_id, data, index_dir=DEDUP_INDEX_DIR):
+    """
+    재파싱으로 이름/필드가 바뀐 영수증(receipt_id)의 항목을 새 결과로 바꾼다.
+    과세유형이 "오류" 가 되었으면 재사용하지 않도록 항목을 제거한다.
+    """
+    index_path, lock_path = _index_paths(client_ip, index_dir)
+    if not os.path.exists(index_path):
+        return
+    _acquire_lock(lock_path)
+    try:
+        entries = []
+        for entry in _load_index(index_path):
+            if entry["status"] == "done" and (entry.get("data") or {}).get("receipt_id") == receipt_id:
+                if data.get("tax_type") == "오류":
+                    continue
+                entry["data"] = dict(entry["data"], **data)
+            entries.append(entry)
+        _save_index(index_path, entries)
+    finally:
+        _release_lock(lock_path)
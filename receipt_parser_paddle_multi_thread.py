@@ -8,7 +8,6 @@ import csv
 import shutil
 import requests
 import numpy as np
-from paddleocr import PaddleOCR
 from PIL import Image, ImageDraw, ImageFont
 from concurrent.futures import ProcessPoolExecutor, as_completed # 병렬처리
 from pdf2image import convert_from_path
@@ -349,6 +348,42 @@ def extract_payment_amount(lines):
 
     return None
 
+APPROVAL_REGEX = re.compile(r"\d{6,12}")
+
+def extract_approval_number(lines):
+    """
+    '승인번호 12345678' 또는 '승인번호' 다음 줄의 숫자 → '12345678'
+    """
+    for i, line in enumerate(lines):
+        if "승인" in line and "번호" in line:
+            m = APPROVAL_REGEX.search(line)
+            if m is None and i + 1 < len(lines):
+                m = APPROVAL_REGEX.search(lines[i + 1])
+            if m is not None:
+                return m.group()
+    return None
+
+def extract_receipt_fields(result):
+    """
+    OCR 결과 하나에서 결제일자/사업자번호/가맹점명/결제금액/승인번호를 한 번에 추출
+    (웹 워커, 벤치마크 등에서 같은 규칙을 쓰기 위함)
+    """
+    text = extract_text_from_paddle(result)
+    lines = get_ocr_lines(result)
+
+    if "거래일시" in lines:
+        pay_date = extract_payment_date_with_keyword(lines)
+    else:
+        pay_date = extract_payment_date_without_keyword(text)
+
+    return {
+        "pay_date": pay_date,
+        "biz_no": extract_biz_number(lines),
+        "merchant": extract_merchant_name(lines),
+        "amount": extract_payment_amount(lines),
+        "approval_no": extract_approval_number(lines),
+    }
+
 # ===============================
 # 4. 국세청 과세유형 조회
 # ===============================
@@ -407,7 +442,8 @@ def copy_and_rename(src, date, tax_type, merchant, payment_amount):
     shutil.copy2(src, dst)
     return new_name
 
-def get_img_arr_from_file_name(file_full_path):
+# resize=False: 여러 영수증 분할처럼 원본 해상도가 필요한 경우
+def get_img_arr_from_file_name(file_full_path, resize=True):
     ext = os.path.splitext(file_full_path)[1].lower()
     if (ext.lower() == ".pdf"):
         pages = convert_from_path(file_full_path, dpi=300)
@@ -424,7 +460,8 @@ def get_img_arr_from_file_name(file_full_path):
     else:
         raise ValueError("확장자 오류")
     
-    img_arr = resize_for_ocr(img_arr)
+    if resize:
+        img_arr = resize_for_ocr(img_arr)
     return img_arr
 
 def process_image(path):
@@ -442,6 +479,7 @@ def process_image(path):
         else:
             raise ValueError("확장자 오류")
         
+        from paddleocr import PaddleOCR
         ocr_engine = PaddleOCR(
             lang="korean",
             use_doc_orientation_classify=False,
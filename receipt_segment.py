@@ -0,0 +1,180 @@
+import cv2
+import numpy as np
+
+# ===============================
+# 여러 영수증이 찍힌 이미지 분할
+# ===============================
+# 영수증 여러 장을 나란히 놓고 한 번에 찍는 경우가 많다.
+# 영수증 종이(밝은 영역)를 배경에서 분리하고 외곽선(contour)으로 영수증별 영역을 찾는다.
+#  - 영역이 2개 이상일 때만 분할 (1개면 기존처럼 이미지 전체를 한 영수증으로 처리)
+#  - 글자가 거의 없는 밝은 영역(냅킨, 빈 종이 등)은 영수증으로 보지 않는다.
+# 한 영수증 안의 어두운 가로 띠(검은 머리말, 바코드 등)도 종이를 위아래로 끊으므로, 잘못 자르지 않도록
+#  - 이미지 테두리 대부분이 배경이 아니면 (영수증이 화면을 꽉 채운 사진, 흰 배경 스캔) 분할하지 않는다.
+#  - 좌우(또는 위아래) 끝이 거의 같고 사이가 가까운 조각은, 그 틈이 테두리 배경과 다르게 보이면 한 영수증으로 합치고
+#    배경처럼 보이면 (어두운 테이블 위 검은 띠인지 영수증 사이인지 알 수 없으므로) 분할하지 않는다.
+#  - 합친 뒤에도 세로로 긴 영수증 모양이 아니거나, 영역 사이의 틈이 배경이 아니면 분할하지 않는다.
+# 애매하면 자르지 않는다. (잘못 자르면 영수증 하나가 필드가 빠진 여러 레코드가 됨)
+
+MIN_AREA_RATIO = 0.04   # 이미지 면적 대비 이보다 작은 영역은 무시
+MIN_INK_RATIO = 0.01    # 영역 안의 글자(어두운 픽셀) 비율이 이보다 작으면 무시
+MAX_REGIONS = 8
+MARGIN_PX = 10          # 잘라낼 때 영역 바깥으로 더 포함할 여백 (원본 해상도 기준)
+WORK_SIZE = 1000        # 분석은 긴 변을 이 크기로 줄여서 수행
+MIN_BORDER_BG_RATIO = 0.6   # 이미지 테두리 픽셀 중 배경(종이가 아닌) 비율이 이보다 작으면 분할하지 않음
+ALIGN_TOL = 0.05        # 두 조각의 좌우 끝 차이가 폭의 이 비율 이내면 같은 종이로 볼 수 있음
+MERGE_GAP_RATIO = 0.15  # 사이 간격이 (더 긴 조각) 높이의 이 비율 이내이고
+BG_TOL = 25             # 틈의 밝기(평균/편차)가 테두리 배경과 이 값 이상 다르면 인쇄된 띠로 보고 합침
+MIN_ASPECT = 0.5        # 영수증 영역의 세로/가로 비율 최소값
+
+def _gap_rect(a, b):
+    """
+    두 영역 사이 틈의 사각형 (x0, y0, x1, y1)
+    겹치거나 붙어 있으면 "touch", 대각선 위치라 틈이 없으면 None
+    """
+    (ax, ay, aw, ah), (bx, by, bw, bh) = a, b
+    y0, y1 = max(ay, by), min(ay + ah, by + bh)
+    x0, x1 = max(ax, bx), min(ax + aw, bx + bw)
+    if y0 < y1 and x0 < x1:
+        return "touch"
+    if y0 < y1:
+        # 좌우로 나란한 두 영역: 세로 틈
+        x0, x1 = min(ax + aw, bx + bw), max(ax, bx)
+    elif x0 < x1:
+        # 위아래로 놓인 두 영역: 가로 틈
+        y0, y1 = min(ay + ah, by + bh), max(ay, by)
+    else:
+        return None
+    if x1 <= x0 or y1 <= y0:
+        return "touch"
+    return x0, y0, x1, y1
+
+def _looks_like_background(gray, rect, bg_mean, bg_std, tol=BG_TOL):
+    # 틈의 밝기 분포가 테두리 배경과 비슷한지 (인쇄된 검은 띠/바코드는 보통 테이블과 다르다)
+    x0, y0, x1, y1 = rect
+    strip = gray[y0:y1, x0:x1]
+    return abs(float(strip.mean()) - bg_mean) <= tol and float(strip.std()) <= bg_std + tol
+
+def _same_paper(a, b, gray, bg_mean, bg_std, align_tol=ALIGN_TOL, gap_ratio=MERGE_GAP_RATIO):
+    """
+    a, b 가 한 영수증이 띠 하나로 끊긴 조각인지
+    (가로 띠 -> 위아래 조각, 세로 띠 -> 좌우 조각: 끝이 거의 같고 가까움)
+    True: 틈이 배경과 다르게 보임 (인쇄된 띠/바코드) -> 합침
+    False: 같은 종이로 볼 수 없음
+    None: 틈이 배경처럼 보여 띠인지 (어두운 테이블 위 검은 띠) 영수증 사이인지 알 수 없음
+    """
+    for (ax, ay, aw, ah), (bx, by, bw, bh) in [(a, b), ([a[1], a[0], a[3], a[2]], [b[1], b[0], b[3], b[2]])]:
+        tol = align_tol * max(aw, bw)
+        aligned = abs(ax - bx) <= tol and abs((ax + aw) - (bx + bw)) <= tol
+        gap = max(by - (ay + ah), ay - (by + bh))
+        if aligned and gap <= gap_ratio * max(ah, bh):
+            rect = _gap_rect(a, b)
+            if rect == "touch":
+                return True
+            if rect is None:
+                return False
+            return None if _looks_like_background(gray, rect, bg_mean, bg_std) else True
+    return False
+
+def _merge_same_paper(boxes, gray, bg_mean, bg_std):
+    """ 같은 종이 조각끼리 합친 영역 목록. 판단할 수 없는 쌍이 있으면 None """
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                same = _same_paper(boxes[i], boxes[j], gray, bg_mean, bg_std)
+                if same is None:
+                    return None
+                if same:
+                    (ax, ay, aw, ah), (bx, by, bw, bh) = boxes[i], boxes[j]
+                    x0, y0 = min(ax, bx), min(ay, by)
+                    x1, y1 = max(ax + aw, bx + bw), max(ay + ah, by + bh)
+                    boxes[i] = (x0, y0, x1 - x0, y1 - y0)
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+def _separated_by_background(a, b, paper, others=(), min_bg_ratio=0.9):
+    """
+    두 영역 사이의 틈이 실제 배경(종이 마스크 0)인지. 겹치거나 붙어 있으면 False
+    틈 안에 있는 다른 영역(others, 가운데 영수증 등)은 배경으로 친다.
+    """
+    rect = _gap_rect(a, b)
+    if rect is None:
+        return True
+    if rect == "touch":
+        return False
+    x0, y0, x1, y1 = rect
+    strip = paper[y0:y1, x0:x1].copy()
+    for ox, oy, ow, oh in others:
+        strip[max(oy - y0, 0):max(oy + oh - y0, 0), max(ox - x0, 0):max(ox + ow - x0, 0)] = 0
+    return np.count_nonzero(strip == 0) >= strip.size * min_bg_ratio
+
+def find_receipt_regions(img_arr, min_area_ratio=MIN_AREA_RATIO, min_ink_ratio=MIN_INK_RATIO,
+                         max_regions=MAX_REGIONS, margin_px=MARGIN_PX):
+    """
+    영수증 영역 [(x, y, w, h), ...] 반환 (원본 좌표, 대략 위->아래, 왼->오른쪽 순서)
+    영수증이 하나로 보이면 빈 리스트
+    """
+    h, w = img_arr.shape[:2]
+    scale = min(WORK_SIZE / max(h, w), 1.0)
+    small = cv2.resize(img_arr, (max(int(w * scale), 1), max(int(h * scale), 1)), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY) if small.ndim == 3 else small
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+    # 1. 종이(밝은 영역) 마스크: 글자 사이 틈은 closing 으로 메우고, 작은 잡음은 opening 으로 제거
+    _, paper = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+    paper = cv2.morphologyEx(paper, cv2.MORPH_CLOSE, kernel)
+    paper = cv2.morphologyEx(paper, cv2.MORPH_OPEN, kernel)
+
+    # 2. 글자 마스크 (종이 안의 어두운 픽셀)
+    ink = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+
+    # 3. 영수증 바깥에 배경(테이블 등)이 보여야 분할 가능
+    border = np.concatenate([paper[0], paper[-1], paper[:, 0], paper[:, -1]])
+    if np.count_nonzero(border == 0) < border.size * MIN_BORDER_BG_RATIO:
+        return []
+    border_gray = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])[border == 0].astype(np.float32)
+    bg_mean, bg_std = float(border_gray.mean()), float(border_gray.std())
+
+    contours, _ = cv2.findContours(paper, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    image_area = small.shape[0] * small.shape[1]
+    # 띠로 끊긴 조각(머리말 위쪽 등)은 작을 수 있으므로 크기 확인 전에 먼저 합친다.
+    boxes = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) >= image_area * min_area_ratio / 10]
+
+    # 4. 띠로 끊긴 한 영수증의 조각 합치기 -> 크기/글자/영수증 모양/겹침 확인
+    boxes = _merge_same_paper(boxes, gray, bg_mean, bg_std)
+    if boxes is None:
+        return []
+    boxes = [(x, y, bw, bh) for x, y, bw, bh in boxes
+             if bw * bh >= image_area * min_area_ratio
+             and np.count_nonzero(ink[y:y + bh, x:x + bw]) >= bw * bh * min_ink_ratio]
+    if len(boxes) < 2:
+        return []
+    if any(bh < bw * MIN_ASPECT for _, _, bw, bh in boxes):
+        return []
+    for i, a in enumerate(boxes):
+        for b in boxes[i + 1:]:
+            if not _separated_by_background(a, b, paper, [o for o in boxes if o is not a and o is not b]):
+                return []
+
+    # 너무 많이 잡히면 큰 영역만 사용
+    boxes = sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)[:max_regions]
+
+    # 세로 위치를 줄 단위(가장 작은 영역 높이의 절반)로 묶은 후 왼쪽부터
+    row_h = max(min(b[3] for b in boxes) // 2, 1)
+    boxes.sort(key=lambda b: (b[1] // row_h, b[0]))
+
+    regions = []
+    for x, y, bw, bh in boxes:
+        x0 = max(int(x / scale) - margin_px, 0)
+        y0 = max(int(y / scale) - margin_px, 0)
+        x1 = min(int((x + bw) / scale) + margin_px, w)
+        y1 = min(int((y + bh) / scale) + margin_px, h)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+    return regions
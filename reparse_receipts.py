@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from worker import reparse_receipt
+from ocr_store import get_raw_path, list_raw_ids
+
+# ===============================
+# 저장된 OCR 결과 일괄 재파싱 (OCR 생략)
+# ===============================
+# 파싱 규칙(extract_*)을 고친 뒤 한 달치 영수증을 OCR 없이 다시 추출할 때 사용
+# 사용 예)
+#   python reparse_receipts.py --raw_dir ocr_raw/1.2.3.4 \
+#                              --result_dir ocr_result/1.2.3.4 \
+#                              --vis_dir ocr_result/vis/1.2.3.4 \
+#                              --out reparsed.ndjson
+# 결과 파일은 제자리에서 이름이 바뀌고, 바뀐 레코드는 NDJSON 으로 출력된다.
+# --dedup_index_dir 를 주면 중복 인덱스(raw_dir 폴더 이름 = IP)의 같은 영수증 항목도 새 결과로 바꾼다.
+
+def main():
+    parser = argparse.ArgumentParser(description="저장된 OCR 결과로 영수증 정보 재추출")
+    parser.add_argument("--raw_dir", required=True)
+    parser.add_argument("--result_dir", required=True)
+    parser.add_argument("--vis_dir", required=True)
+    parser.add_argument("--service_key", default=None, help="사업자번호가 바뀐 경우 국세청 재조회용 키")
+    parser.add_argument("--dedup_index_dir", default=None, help="중복 인덱스 폴더 (config.yaml 의 dedup.index_dir)")
+    parser.add_argument("--out", default=None, help="NDJSON 출력 파일 (없으면 stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    ids = list_raw_ids(args.raw_dir)
+    dedup_user = os.path.basename(os.path.normpath(args.raw_dir))
+    print(f"▶ {len(ids)} receipts", file=sys.stderr)
+
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(reparse_receipt, get_raw_path(args.raw_dir, i), "cli",
+                                   args.service_key, args.result_dir, args.vis_dir,
+                                   args.dedup_index_dir, dedup_user): i
+                   for i in ids}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                result = {"status": "error", "message": str(e), "data": {"receipt_id": futures[future]}}
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    if out is not sys.stdout:
+        out.close()
+    print(f"✅ 재파싱 완료 (실패 {failed}건)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import os
+import time
+import shutil
+import asyncio
+from datetime import datetime
+
+# ===============================
+# 저장소 정리 (Storage Janitor)
+# ===============================
+# 핸들러 안에서 shutil.rmtree 를 직접 호출하면 큰 폴더 삭제 동안 이벤트 루프가 멈춘다.
+# 그래서 유저 폴더는 rename 으로 즉시 "퇴역" 시키고, 실제 삭제는 백그라운드 작업에서 한다.
+
+TRASH_DIR = "trash"
+# 휴지통이 다른 파일시스템이라 rename 할 수 없을 때, 같은 부모 폴더 안에서 이 접두어로 이름만 바꿔둔다.
+RETIRED_PREFIX = ".retired_"
+
+# 최근 정리 결과 (/api/storage 에서 노출)
+storage_stats = {
+    "updated_at": None,
+    "total_bytes": 0,
+    "trash_bytes": 0,
+    "retained_bytes": 0,    # retention_dirs (quota 제외) 사용량
+    "users": {},
+    "evicted_files": 0,
+    "evicted_bytes": 0,
+}
+
+# 유저(IP 폴더 이름)별 마지막 업로드 배치 시작 시각
+# 이 시각 이후의 파일(처리 중인 업로드, 아직 다운로드하지 않은 결과)은 quota 정리에서 제외한다.
+batch_started_at = {}
+
+def mark_batch_start(user_name):
+    batch_started_at[user_name] = time.time()
+
+def retire_dir(path, trash_dir=TRASH_DIR):
+    """
+    폴더를 휴지통으로 rename 한 뒤 빈 폴더를 다시 만든다.
+    rename 은 같은 파일시스템 안에서 원자적이고 즉시 끝나므로 핸들러에서 호출해도 된다.
+    """
+    if os.path.exists(path):
+        os.makedirs(trash_dir, exist_ok=True)
+        # 같은 IP 폴더가 여러번 퇴역될 수 있으므로 시간 + 원래 경로로 이름을 만든다.
+        tag = path.strip(os.sep).replace(os.sep, "__")
+        dst = os.path.join(trash_dir, f"{time.time_ns()}_{tag}")
+        try:
+            os.rename(path, dst)
+        except OSError:
+            # 다른 파일시스템이라 휴지통으로 rename 이 불가능한 경우: 같은 부모 폴더 안에서 이름만 바꾼다.
+            # (여기서 rmtree 하면 이벤트 루프가 멈춘다. 삭제는 janitor 가 purge_retired 에서 수행)
+            parent, name = os.path.split(os.path.normpath(path))
+            try:
+                os.rename(path, os.path.join(parent, f"{RETIRED_PREFIX}{time.time_ns()}_{name}"))
+            except OSError as e:
+                # 이름도 못 바꾸면 그대로 두고 재사용 (남은 파일은 TTL/quota 정리 대상)
+                print("Failed to retire dir : ", path, e)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def get_dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def purge_trash(trash_dir=TRASH_DIR):
+    if not os.path.exists(trash_dir):
+        return
+    for name in os.listdir(trash_dir):
+        shutil.rmtree(os.path.join(trash_dir, name), ignore_errors=True)
+
+def purge_retired(base_dirs):
+    # retire_dir 가 휴지통 대신 base 폴더 안에 남겨둔 퇴역 폴더 삭제
+    for base in base_dirs:
+        if not os.path.exists(base):
+            continue
+        for name in os.listdir(base):
+            if name.startswith(RETIRED_PREFIX):
+                shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+
+def list_user_files(base_dirs):
+    """
+    base 폴더 바로 아래의 IP 폴더들을 훑어서 {ip: [(mtime, size, path), ...]} 를 만든다.
+    (vis 폴더처럼 result_dir 안에 있는 다른 base 폴더는 base_dirs 에 따로 들어있으므로 건너뛴다.)
+    """
+    base_set = {os.path.abspath(b) for b in base_dirs}
+    users = {}
+    for base in base_dirs:
+        if not os.path.exists(base):
+            continue
+        for ip in os.listdir(base):
+            user_path = os.path.join(base, ip)
+            if not os.path.isdir(user_path) or os.path.abspath(user_path) in base_set or ip.startswith(RETIRED_PREFIX):
+                continue
+            for root, _, files in os.walk(user_path):
+                for name in files:
+                    file_path = os.path.join(root, name)
+                    try:
+                        st = os.stat(file_path)
+                    except OSError:
+                        continue
+                    users.setdefault(ip, []).append((st.st_mtime, st.st_size, file_path))
+    return users
+
+def evict_file(file_path):
+    try:
+        size = os.path.getsize(file_path)
+        os.remove(file_path)
+        return size
+    except OSError:
+        return 0
+
+def run_janitor_once(base_dirs, ttl_sec, user_quota_bytes, global_quota_bytes, trash_dir=TRASH_DIR,
+                     protected_since=None, retention_dirs=None):
+    """
+    1. 휴지통(+ base 폴더 안의 퇴역 폴더) 비우기
+    2. TTL 이 지난 파일 삭제
+    3. 유저별 quota 초과 시 오래된 파일부터 삭제
+    4. 전체 quota 초과 시 모든 유저 통틀어 오래된 파일부터 삭제
+    protected_since: {ip: 배치 시작 시각}. 현재 배치의 파일은 quota 를 넘어도 지우지 않는다.
+    retention_dirs: {폴더: TTL 초}. 재파싱용 OCR 원본처럼 오래 보관하는 폴더는 자기 TTL 로만 지우고 quota 정리는 하지 않는다.
+    """
+    protected_since = protected_since or {}
+    def evictable(ip, mtime):
+        # mtime 해상도가 거친 파일시스템을 고려해 1초 여유
+        return ip not in protected_since or mtime < protected_since[ip] - 1
+
+    purge_trash(trash_dir)
+    purge_retired(base_dirs)
+
+    now = time.time()
+    evicted_files = 0
+    evicted_bytes = 0
+
+    users = list_user_files(base_dirs)
+    for ip, files in users.items():
+        kept = []
+        for mtime, size, file_path in files:
+            if ttl_sec and now - mtime > ttl_sec:
+                evicted_bytes += evict_file(file_path)
+                evicted_files += 1
+            else:
+                kept.append((mtime, size, file_path))
+
+        if user_quota_bytes:
+            kept.sort()
+            used = sum(size for _, size, _ in kept)
+            candidates = [f for f in kept if evictable(ip, f[0])]
+            while candidates and used > user_quota_bytes:
+                mtime, size, file_path = candidates.pop(0)
+                kept.remove((mtime, size, file_path))
+                used -= size
+                evicted_bytes += evict_file(file_path)
+                evicted_files += 1
+        users[ip] = kept
+
+    if global_quota_bytes:
+        used = sum(size for files in users.values() for _, size, _ in files)
+        candidates = sorted(f + (ip,) for ip, files in users.items() for f in files if evictable(ip, f[0]))
+        while candidates and used > global_quota_bytes:
+            mtime, size, file_path, ip = candidates.pop(0)
+            used -= size
+            evicted_bytes += evict_file(file_path)
+            evicted_files += 1
+            users[ip].remove((mtime, size, file_path))
+
+    retained_bytes = 0
+    for base, dir_ttl_sec in (retention_dirs or {}).items():
+        for files in list_user_files([base]).values():
+            for mtime, size, file_path in files:
+                if dir_ttl_sec and now - mtime > dir_ttl_sec:
+                    evicted_bytes += evict_file(file_path)
+                    evicted_files += 1
+                else:
+                    retained_bytes += size
+
+    user_bytes = {ip: sum(size for _, size, _ in files) for ip, files in users.items()}
+    storage_stats["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    storage_stats["users"] = user_bytes
+    storage_stats["total_bytes"] = sum(user_bytes.values())
+    storage_stats["retained_bytes"] = retained_bytes
+    storage_stats["trash_bytes"] = get_dir_size(trash_dir) if os.path.exists(trash_dir) else 0
+    storage_stats["evicted_files"] += evicted_files
+    storage_stats["evicted_bytes"] += evicted_bytes
+    return storage_stats
+
+async def janitor_loop(base_dirs, interval_sec, ttl_sec, user_quota_bytes, global_quota_bytes, trash_dir=TRASH_DIR,
+                       retention_dirs=None):
+    """
+    서버 시작 시 백그라운드 태스크로 띄운다.
+    실제 파일 작업은 기본 스레드 풀에서 수행하여 이벤트 루프를 막지 않는다.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            # 배치 시작 시각은 이벤트 루프에서만 바뀌므로 여기서 복사해서 넘긴다.
+            await loop.run_in_executor(None, run_janitor_once,
+                                       base_dirs, ttl_sec,
+                                       user_quota_bytes, global_quota_bytes,
+                                       trash_dir, dict(batch_started_at), retention_dirs)
+        except Exception as e:
+            print("Storage janitor failed : ", e)
+        await asyncio.sleep(interval_sec)
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+
+# ===============================
+# 분산 OCR 작업 큐 (SQLite 브로커)
+# ===============================
+# 코디네이터(main.py)가 작업을 넣고, 다른 머신의 워커 노드(ocr_worker_node.py)가
+# HTTP(/api/broker/*)를 통해 작업을 가져가서 결과를 돌려준다.
+# 큐 상태는 코디네이터 로컬의 SQLite 파일 하나에 저장한다. (추가 서버 불필요)
+#  - 워커는 등록 후 주기적으로 heartbeat
+#  - heartbeat 가 끊긴 워커의 작업은 다시 큐에 넣는다 (max_attempts 초과 시 오류 결과로 종료)
+#  - heartbeat 는 살아 있어도 할당 후 lease_timeout_sec 안에 끝나지 않은 작업도 같은 방식으로 다시 넣는다.
+#    (노드가 파일 받기/결과 전송 실패 후 작업을 놓친 경우 배치가 영원히 끝나지 않는 것 방지)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id          TEXT PRIMARY KEY,
+    batch_id    TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    status      TEXT NOT NULL,      -- queued | running | done
+    worker_id   TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    result      TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_batch ON tasks(batch_id, status);
+CREATE TABLE IF NOT EXISTS workers (
+    id              TEXT PRIMARY KEY,
+    host            TEXT,
+    pid             INTEGER,
+    registered_at   REAL NOT NULL,
+    last_heartbeat  REAL NOT NULL,
+    tasks_done      INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+class TaskBroker:
+    def __init__(self, db_path, heartbeat_timeout_sec=30, max_attempts=2, lease_timeout_sec=600):
+        self.db_path = db_path
+        self.heartbeat_timeout_sec = heartbeat_timeout_sec
+        self.lease_timeout_sec = lease_timeout_sec
+        self.max_attempts = max_attempts
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # 호출마다 새 연결을 쓴다. (sqlite3 연결은 스레드 간 공유 불가)
+        # isolation_level=None 으로 두고 쓰기는 BEGIN IMMEDIATE 로 직접 묶는다.
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # --- 코디네이터 ---
+    def enqueue(self, batch_id, payload):
+        task_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT INTO tasks (id, batch_id, payload, status, created_at, updated_at) "
+                         "VALUES (?, ?, ?, 'queued', ?, ?)",
+                         (task_id, batch_id, json.dumps(payload, ensure_ascii=False), now, now))
+        return task_id
+
+    def get_task(self, task_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def pop_finished(self, batch_id):
+        """배치에서 끝난 작업 결과를 꺼내고(삭제) [(task_id, result), ...] 반환"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("SELECT id, result FROM tasks WHERE batch_id = ? AND status = 'done' "
+                                "ORDER BY updated_at", (batch_id,)).fetchall()
+            conn.executemany("DELETE FROM tasks WHERE id = ?", [(r["id"],) for r in rows])
+            conn.execute("COMMIT")
+        return [(r["id"], json.loads(r["result"])) for r in rows]
+
+    def cancel_batch(self, batch_id):
+        # 클라이언트가 스트림을 끊은 경우 남은 작업 제거
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tasks WHERE batch_id = ?", (batch_id,))
+
+    def _requeue_or_fail(self, conn, task, now, reason):
+        # 재시도 횟수가 남았으면 다시 대기열로, 아니면 오류 결과로 끝낸다.
+        if task["attempts"] < self.max_attempts:
+            conn.execute("UPDATE tasks SET status = 'queued', worker_id = NULL, updated_at = ? "
+                         "WHERE id = ?", (now, task["id"]))
+        else:
+            payload = json.loads(task["payload"])
+            result = {"status": "error",
+                      "message": reason,
+                      "data": {"original_name": payload.get("original_name")}}
+            conn.execute("UPDATE tasks SET status = 'done', result = ?, updated_at = ? WHERE id = ?",
+                         (json.dumps(result, ensure_ascii=False), now, task["id"]))
+
+    def reap_dead_workers(self):
+        """heartbeat 가 끊긴 워커를 지우고, 그 워커가 잡고 있던 작업을 다시 큐에 넣는다."""
+        now = time.time()
+        deadline = now - self.heartbeat_timeout_sec
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            dead = [r["id"] for r in conn.execute("SELECT id FROM workers WHERE last_heartbeat < ?", (deadline,))]
+            for worker_id in dead:
+                print("Broker: worker lost ", worker_id)
+                for task in conn.execute("SELECT * FROM tasks WHERE worker_id = ? AND status = 'running'",
+                                         (worker_id,)).fetchall():
+                    self._requeue_or_fail(conn, task, now, "worker lost")
+                conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+            conn.execute("COMMIT")
+        return dead
+
+    def reap_expired_tasks(self):
+        """할당 후 lease_timeout_sec 가 지난 작업을 다시 큐에 넣는다. (running 작업의 updated_at = 할당 시각)"""
+        if not self.lease_timeout_sec:
+            return []
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = conn.execute("SELECT * FROM tasks WHERE status = 'running' AND updated_at < ?",
+                                   (now - self.lease_timeout_sec,)).fetchall()
+            for task in expired:
+                print("Broker: task lease expired ", task["id"], task["worker_id"])
+                self._requeue_or_fail(conn, task, now, "task timed out")
+            conn.execute("COMMIT")
+        return [task["id"] for task in expired]
+
+    def stats(self):
+        with self._connect() as conn:
+            counts = {r["status"]: r["n"] for r in
+                      conn.execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status")}
+            workers = [dict(r) for r in conn.execute("SELECT * FROM workers ORDER BY registered_at")]
+        return {"tasks": counts, "workers": workers}
+
+    # --- 워커 노드 ---
+    def register_worker(self, host, pid):
+        worker_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT INTO workers (id, host, pid, registered_at, last_heartbeat) VALUES (?, ?, ?, ?, ?)",
+                         (worker_id, host, pid, now, now))
+        return worker_id
+
+    def heartbeat(self, worker_id):
+        """등록되지 않은(이미 정리된) 워커면 False"""
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE workers SET last_heartbeat = ? WHERE id = ?", (time.time(), worker_id))
+        return cur.rowcount > 0
+
+    def claim(self, worker_id):
+        """가장 오래된 대기 작업 하나를 이 워커에 할당. 없으면 None"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM workers WHERE id = ?", (worker_id,)).fetchone() is None:
+                conn.execute("ROLLBACK")
+                return None
+            row = conn.execute("SELECT * FROM tasks WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute("UPDATE tasks SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+                         "updated_at = ? WHERE id = ?", (worker_id, now, row["id"]))
+            conn.execute("UPDATE workers SET last_heartbeat = ? WHERE id = ?", (now, worker_id))
+            conn.execute("COMMIT")
+        return {"task_id": row["id"], "payload": json.loads(row["payload"])}
+
+    def complete(self, task_id, worker_id, result):
+        """작업 결과 기록. 다른 워커로 재할당된 작업이면 False (결과 무시)"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute("UPDATE tasks SET status = 'done', result = ?, updated_at = ? "
+                               "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                               (json.dumps(result, ensure_ascii=False), now, task_id, worker_id))
+            if cur.rowcount:
+                conn.execute("UPDATE workers SET tasks_done = tasks_done + 1, last_heartbeat = ? WHERE id = ?",
+                             (now, worker_id))
+            conn.execute("COMMIT")
+        return cur.rowcount > 0
@@ -0,0 +1,51 @@
+import os
+import tempfile
+from PIL import Image
+
+# ===============================
+# 결과 이미지 썸네일 (WebP)
+# ===============================
+# 결과 목록에서 원본/vis 이미지를 그대로 띄우면 수백 MB 를 받아야 하므로
+# 고정된 크기의 WebP 썸네일을 처음 요청될 때 만들고 디스크에 캐시한다.
+
+THUMB_SIZES = (160, 320, 640)
+THUMB_QUALITY = 75
+
+def get_source_tag(src_path):
+    """
+    원본 파일 식별자 (inode/수정시각/크기)
+    재파싱 이름 변경(os.link)은 수정시각을 그대로 두므로, 같은 이름을 나중에 다른 영수증이 쓰게 되면
+    "썸네일이 원본보다 새것" 비교로는 이전 영수증의 썸네일이 나간다. 그래서 캐시 파일 이름 자체에 넣는다.
+    """
+    st = os.stat(src_path)
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+def get_thumb_etag(src_path, size):
+    """원본 파일 식별자 + 썸네일 크기로 만든 strong ETag"""
+    return f'"{size}-{get_source_tag(src_path)}"'
+
+def get_thumbnail(src_path, thumb_dir, size):
+    """
+    thumb_dir/<원본 이름>.<원본 식별자>.webp 가 있으면 그대로, 없으면 새로 만들고 경로 반환
+    동시에 같은 썸네일을 요청해도 깨지지 않도록 임시 파일에 쓴 뒤 rename
+    (웹 프로세스의 스레드 풀에서 실행되므로 pid 가 아닌 mkstemp 로 요청마다 다른 임시 파일 사용)
+    """
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    thumb_path = os.path.join(thumb_dir, f"{stem}.{get_source_tag(src_path)}.webp")
+    if os.path.exists(thumb_path):
+        return thumb_path
+
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    with Image.open(src_path) as img:
+        img = img.convert("RGB")
+        img.thumbnail((size, size))
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(thumb_path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, format="WEBP", quality=THUMB_QUALITY, method=4)
+            os.replace(tmp_path, thumb_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return thumb_path
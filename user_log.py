@@ -1,21 +1,31 @@
 import os
 from datetime import datetime
 import json
+from nts_rate_limiter import get_key_id
 
 USAGE_LOG = "usage_log.json"
+
+# config.yaml 의 nts.usage_log (부하 테스트는 작업 폴더 안의 별도 파일을 쓴다)
+def configure_usage_log(path):
+    global USAGE_LOG
+    if path:
+        USAGE_LOG = path
 # --- 2. 호출 횟수 관리 (IP별 로그) ---
 def get_usage_data():
     if not os.path.exists(USAGE_LOG): return {}
     with open(USAGE_LOG, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def log_api_call(ip):
+# 서비스 키별 호출 수도 기록 (키 원문 대신 호출 제한과 같은 key_id)
+def log_api_call(ip, service_key=None):
     today = datetime.now().strftime("%Y-%m-%d")
     data = get_usage_data()
     if today not in data:
         data[today] = {"total": 0, "ips": {}}
     data[today]["total"] += 1
     data[today]["ips"][ip] = data[today]["ips"].get(ip, 0) + 1
+    keys = data[today].setdefault("keys", {})
+    keys[get_key_id(service_key)] = keys.get(get_key_id(service_key), 0) + 1
     with open(USAGE_LOG, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=4)
     return data[today]["total"]
\ No newline at end of file
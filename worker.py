@@ -1,4 +1,6 @@
 import os
+import uuid
+import tempfile
 from pdf2image import convert_from_path
 # 작성하신 파서 파일에서 함수 임포트
 from receipt_parser_paddle_multi_thread import (
@@ -6,7 +8,16 @@ from receipt_parser_paddle_multi_thread import (
     extract_merchant_name, extract_payment_date_with_keyword, 
     extract_payment_date_without_keyword, extract_payment_amount, 
     resize_for_ocr, normalize_tax_type,
-    draw_bb_on_img, get_img_arr_from_file_name
+    draw_bb_on_img, get_img_arr_from_file_name,
+    extract_receipt_fields
+)
+from ocr_engine import create_ocr_engine
+from PIL import Image
+from ocr_store import get_raw_path, save_ocr_raw, load_ocr_raw, update_ocr_meta
+from receipt_segment import find_receipt_regions, MIN_AREA_RATIO, MAX_REGIONS
+from receipt_dedup import (
+    image_hashes, claim_or_match, complete_entry, update_entry, same_receipt_fields,
+    DEDUP_INDEX_DIR, HAMMING_THRESHOLD, REGION_THRESHOLD
 )
 
 
@@ -15,13 +26,29 @@ from receipt_parser_paddle_multi_thread import (
 # 4. 국세청 과세유형 조회
 # ===============================
 import requests
-from user_log import log_api_call
-def get_tax_type_from_nts_with_api_call_counter(client_ip, biz_no, service_key):
+from user_log import log_api_call, configure_usage_log
+from nts_rate_limiter import acquire_nts_token, configure_nts_limiter
+
+# 부하 테스트 시 로컬 mock 서버로 바꿀 수 있도록 config.yaml 의 nts.api_url 로 설정 (사용량 기록 파일은 nts.usage_log)
+NTS_API_URL = "https://api.odcloud.kr/api/nts-businessman/v1/status"
+def configure_nts(nts_conf):
+    global NTS_API_URL
+    if nts_conf and nts_conf.get("api_url"):
+        NTS_API_URL = nts_conf["api_url"]
+    if nts_conf:
+        configure_usage_log(nts_conf.get("usage_log"))
+    configure_nts_limiter(nts_conf)
+
+def get_tax_type_from_nts_with_api_call_counter(client_ip, biz_no, service_key, priority="batch"):
     if not biz_no:
         print("Biz_no is not exist")
         return "오류"
 
-    url = "https://api.odcloud.kr/api/nts-businessman/v1/status"
+    # 프로세스 간 공유 token bucket: 초당 한도면 기다리고, 일일 한도를 넘으면 호출하지 않음
+    if not acquire_nts_token(service_key, priority):
+        return "오류"
+
+    url = NTS_API_URL
     payload = {"b_no": [biz_no.replace("-", "")]}
     headers = {"Content-Type" : "application/json",
                "accept" : "application/json"}
@@ -35,7 +62,7 @@ def get_tax_type_from_nts_with_api_call_counter(client_ip, biz_no, service_key):
             data = r.json()
 
             info = data["data"][0]
-            log_api_call(client_ip)
+            log_api_call(client_ip, service_key)
             return info.get("tax_type", "UNKNOWN")
     
         except Exception as e:
@@ -44,25 +71,218 @@ def get_tax_type_from_nts_with_api_call_counter(client_ip, biz_no, service_key):
             print(e)
             return "오류"
 
+# 파일명 변경 규칙 적용
+# [YYMMDD]_[TaxType]_[Amount]_[Merchant]
+# suffix: 다른 영수증과 이름이 겹칠 때 붙이는 구분자 (receipt_id 앞 6자리)
+def build_result_names(fields, tax_type, suffix=None):
+    base_name = f"{fields['pay_date']}_{tax_type}_{fields['amount']}_{fields['merchant']}"
+    if suffix:
+        base_name = f"{base_name}_{suffix}"
+    return f"{base_name}.png", f"{base_name}_vis.png"
+
+# [(old_path, new_path), ...] 를 덮어쓰지 않고 옮긴다.
+# os.link 는 대상이 있으면 실패하므로 여러 스레드/프로세스가 동시에 재파싱해도 파일을 잃지 않는다.
+# 하나라도 이미 있으면 만든 링크를 되돌리고 False
+def move_without_overwrite(moves):
+    linked = []
+    try:
+        for old_path, new_path in moves:
+            os.link(old_path, new_path)
+            linked.append(new_path)
+    except FileExistsError:
+        for new_path in linked:
+            os.remove(new_path)
+        return False
+    for old_path, _ in moves:
+        os.remove(old_path)
+    return True
+
+# 원본/vis 파일(sources = (원본 경로, vis 경로), 없으면 None)을 결과 이름으로 옮기고 (renamed_name, vis_name) 반환
+# 다른 영수증이 이미 같은 이름(같은 날짜/금액/가맹점)을 쓰고 있으면 receipt_id 앞 6자리를 붙인다.
+def move_to_result_names(sources, fields, tax_type, receipt_id, result_dir, ocr_vis_dir):
+    for suffix in [None, receipt_id[:6]]:
+        renamed_name, visualized_name = build_result_names(fields, tax_type, suffix)
+        moves = [(src, os.path.join(folder, name))
+                 for src, folder, name in zip(sources, [result_dir, ocr_vis_dir], [renamed_name, visualized_name])
+                 if src and src != os.path.join(folder, name)]
+        if move_without_overwrite(moves):
+            return renamed_name, visualized_name
+    raise FileExistsError(f"결과 파일 이름 충돌: {renamed_name}")
+
+# 결과 이미지를 같은 폴더의 임시 파일로 저장 (이름을 정한 뒤 move_to_result_names 로 옮긴다)
+def save_temp_image(image_pil, folder):
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=folder)
+    with os.fdopen(fd, "wb") as f:
+        image_pil.save(f, format="PNG")
+    return tmp_path
+
+# OCR 실행 + 정보 추출 + 결과 이미지 저장
+# candidate: 모양이 비슷한 이전 영수증 결과 (중복 인덱스). 주요 필드가 모두 같으면 국세청 조회 없이 과세유형 재사용
+def ocr_and_save_receipt(img_arr, original_filename, client_ip, active_key, result_dir, ocr_vis_dir, raw_dir=None,
+                         candidate=None):
+    ocr_res = local_ocr.ocr(img_arr)
+    ocr_res = ocr_res[0]
+
+    fields = extract_receipt_fields(ocr_res)
+    pay_date = fields["pay_date"]
+    biz_no   = fields["biz_no"]
+    merchant = fields["merchant"]
+    amount   = fields["amount"]
+
+    # API 호출 및 로그 기록
+    tax_type = "오류"
+    duplicate_of = None
+    if candidate and same_receipt_fields(fields, candidate):
+        # 같은 영수증을 다시 찍은 것
+        tax_type = candidate["tax_type"]
+        duplicate_of = candidate["original_name"]
+        print("Duplicate receipt: ", original_filename, "->", duplicate_of)
+    elif biz_no and active_key:
+        tax_type = get_tax_type_from_nts_with_api_call_counter(client_ip, biz_no, active_key)
+        tax_type = normalize_tax_type(tax_type)
+
+    receipt_id = uuid.uuid4().hex
+
+    # New
+    # (A) 이름만 바뀐 원본 이미지, (B) OCR 결과(BB)가 포함된 이미지를 임시 파일로 저장한 후
+    # 같은 이름의 다른 영수증 결과를 덮어쓰지 않도록 move_to_result_names 로 옮긴다.
+    tmp_paths = [save_temp_image(Image.fromarray(img_arr), result_dir),
+                 save_temp_image(draw_bb_on_img(img_arr, ocr_res), ocr_vis_dir)]
+    try:
+        renamed_name, visualized_name = move_to_result_names(tmp_paths, fields, tax_type, receipt_id,
+                                                             result_dir, ocr_vis_dir)
+    finally:
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    data = {
+        "receipt_id": receipt_id,
+        "original_name": original_filename,
+        "renamed_name": renamed_name,
+        "vis_name": visualized_name,
+        "merchant": merchant,
+        "biz_no": biz_no,
+        "pay_date": pay_date,
+        "amount": amount,
+        "tax_type": tax_type
+    }
+    if duplicate_of:
+        data["duplicate_of"] = duplicate_of
+
+    # (C) 재파싱을 위해 OCR 원본 결과 저장 (메타데이터 = 위 결과)
+    if raw_dir:
+        save_ocr_raw(get_raw_path(raw_dir, data["receipt_id"]), ocr_res, data)
+    return data
+
+# 저장된 OCR 결과로 정보 추출/파일명 변경만 다시 수행 (OCR 생략)
+# dedup_index_dir 가 있으면 중복 인덱스의 같은 영수증 항목도 새 결과로 바꾼다. (dedup_user: 인덱스 IP, 기본 client_ip)
+def reparse_receipt(raw_path, client_ip, active_key, result_dir, ocr_vis_dir, dedup_index_dir=None, dedup_user=None):
+    ocr_res, meta = load_ocr_raw(raw_path)
+    fields = extract_receipt_fields(ocr_res)
+
+    # 사업자번호가 바뀌었거나 이전 조회가 실패한 경우에만 국세청 재조회
+    tax_type = meta.get("tax_type", "오류")
+    if fields["biz_no"] != meta.get("biz_no") or tax_type == "오류":
+        tax_type = "오류"
+        if fields["biz_no"] and active_key:
+            tax_type = get_tax_type_from_nts_with_api_call_counter(client_ip, fields["biz_no"], active_key)
+            tax_type = normalize_tax_type(tax_type)
+
+    # 결과 파일은 제자리에서 이름만 변경 (결과 폴더가 이미 정리되어 파일이 하나도 없으면 실패)
+    sources = [os.path.join(folder, name) for folder, name in [(result_dir, meta["renamed_name"]),
+                                                               (ocr_vis_dir, meta["vis_name"])]]
+    sources = [path if os.path.exists(path) else None for path in sources]
+    if not any(sources):
+        raise FileNotFoundError(f"결과 파일 없음: {meta['renamed_name']}")
+    renamed_name, visualized_name = move_to_result_names(sources, fields, tax_type, meta["receipt_id"],
+                                                         result_dir, ocr_vis_dir)
+
+    data = dict(meta, renamed_name=renamed_name, vis_name=visualized_name, tax_type=tax_type, **fields)
+    update_ocr_meta(raw_path, data)
+    if dedup_index_dir:
+        update_entry(dedup_user or client_ip, meta["receipt_id"], data, dedup_index_dir)
+    return {"status": "success", "reparsed": True, "data": data}
+
+# 픽셀이 같은 중복 영수증: OCR 없이 이전 결과를 재사용
+# 이전 배치의 결과라서 결과 폴더가 이미 정리된 경우에는 저장된 OCR 원본 결과로 vis 를 다시 그려서 같은 이름으로 복원한다.
+# 복원할 수 없으면 (OCR 원본이 없거나 그 이름을 다른 영수증이 쓰는 중) None -> 호출자가 OCR
+def reuse_duplicate_result(prev, img_arr, original_filename, result_dir, ocr_vis_dir, raw_dir=None):
+    raw_path = get_raw_path(raw_dir, prev["receipt_id"]) if raw_dir and prev.get("receipt_id") else None
+    if raw_path and os.path.exists(raw_path):
+        ocr_res, meta = load_ocr_raw(raw_path)
+        prev = dict(prev, **meta)   # 재파싱으로 바뀐 이름/필드는 OCR 원본 메타가 최신
+        if prev.get("tax_type") == "오류":
+            return None
+    else:
+        ocr_res = None
+
+    origin_path = os.path.join(result_dir, prev["renamed_name"])
+    vis_path = os.path.join(ocr_vis_dir, prev["vis_name"])
+    # 같은 배치면 같은 파일을 가리키므로 그대로 둔다.
+    if not (os.path.exists(origin_path) and os.path.exists(vis_path)):
+        if ocr_res is None:
+            return None
+        tmp_paths = [save_temp_image(Image.fromarray(img_arr), result_dir),
+                     save_temp_image(draw_bb_on_img(img_arr, ocr_res), ocr_vis_dir)]
+        try:
+            if not move_without_overwrite(list(zip(tmp_paths, [origin_path, vis_path]))):
+                return None
+        finally:
+            for tmp_path in tmp_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    data = dict(prev)
+    data["original_name"] = original_filename
+    data["duplicate_of"] = prev["original_name"]
+    print("Duplicate receipt: ", original_filename, "->", prev["original_name"])
+    return {"status": "success", "duplicate": True, "data": data}
+
+# 워커 프로세스 시작 시 호출 (ManagedWorkerPool initializer)
+# OCR 엔진 설정만 저장하고, 엔진 자체는 첫 작업 때 만든다.
+OCR_ENGINE_CONF = None
+def init_worker(ocr_engine_conf, nts_conf=None):
+    global OCR_ENGINE_CONF
+    OCR_ENGINE_CONF = ocr_engine_conf
+    configure_nts(nts_conf)
+
+# 한 장에 영수증 여러 개가 찍혀 있으면 영수증별 이미지로 잘라서 저장하고 [(경로, 이름), ...] 반환
+# 영수증이 하나면 None (호출자가 그대로 OCR)
+def split_receipt_image(img_arr, original_filename, upload_dir, segment_conf):
+    regions = find_receipt_regions(img_arr,
+                                   min_area_ratio=segment_conf.get("min_area_ratio", MIN_AREA_RATIO),
+                                   max_regions=segment_conf.get("max_regions", MAX_REGIONS))
+    if not regions:
+        return None
+
+    # 잘라낸 이미지는 업로드 폴더 아래 원본 파일별 폴더에 저장 (다른 업로드 파일과 이름 충돌 방지)
+    part_dir = os.path.join(upload_dir, "parts", original_filename)
+    os.makedirs(part_dir, exist_ok=True)
+    stem = os.path.splitext(original_filename)[0]
+    parts = []
+    for k, (x, y, w, h) in enumerate(regions, 1):
+        part_path = os.path.join(part_dir, f"{k}.png")
+        Image.fromarray(img_arr[y:y + h, x:x + w]).save(part_path)
+        parts.append((part_path, f"{stem}_{k}.png"))
+    print("Split receipt: ", original_filename, "->", len(parts))
+    return parts
+
 # 2. 개별 파일을 처리할 독립적인 워커 함수
 # 이 함수는 별도의 프로세스에서 실행되므로 전역 변수에 접근이 어렵습니다.
-def worker_process_receipt(file_info, client_ip, active_key, upload_dir, result_dir, ocr_vis_dir):
-    from paddleocr import PaddleOCR
+# segment_conf 가 있으면 먼저 여러 영수증인지 확인하고, 2개 이상이면 OCR 없이
+# {"status": "split", "parts": [(경로, 이름), ...]} 를 반환한다. (호출자가 영수증별 작업으로 다시 제출)
+def worker_process_receipt(file_info, client_ip, active_key, upload_dir, result_dir, ocr_vis_dir, dedup_conf=None, raw_dir=None,
+                           segment_conf=None):
     import numpy as np
-    from PIL import Image
     results = []
 
     # 각 프로세스 내에서 OCR 엔진을 처음 한 번만 초기화 (Lazy Initialization)
     # 함수 밖에 있으면 직렬화 에러가 날 수 있으므로 내부에서 로드하는 것이 안전합니다.
     global local_ocr
     if 'local_ocr' not in globals():
-        local_ocr = PaddleOCR(
-            lang="korean",
-            use_doc_orientation_classify=False,
-            use_textline_orientation=False,
-            # use_angle_cls=False,
-            use_doc_unwarping=False,
-        )
+        # config.yaml 의 ocr_engine.backend 에 따라 Paddle / ONNX Runtime 엔진 선택
+        local_ocr = create_ocr_engine(OCR_ENGINE_CONF)
             
     temp_path, original_filename = file_info
     print("Start parsing: ", original_filename)
@@ -71,58 +291,51 @@ def worker_process_receipt(file_info, client_ip, active_key, upload_dir, result_
     # try:
         # 이미지 로드 및 OCR 처리 (기존 로직 동일)
         # ... (생략: 이미지 변환 및 ocr 실행) ...
-        img_arr = get_img_arr_from_file_name(temp_path)
-        ocr_res = local_ocr.ocr(img_arr)
-        ocr_res = ocr_res[0]
-        
-        text = extract_text_from_paddle(ocr_res)
-        lines = get_ocr_lines(ocr_res)
-
-        if "거래일시" in lines:
-            pay_date = extract_payment_date_with_keyword(lines)
+        if segment_conf and segment_conf.get("enabled", False):
+            # 분할은 OCR 용으로 줄이기 전의 원본 해상도에서 (나란히 찍은 영수증은 한 장당 폭이 좁다)
+            # 파일은 한 번만 읽고, 영수증이 하나면 줄여서 그대로 OCR
+            img_arr = get_img_arr_from_file_name(temp_path, resize=False)
+            parts = split_receipt_image(img_arr, original_filename, upload_dir, segment_conf)
+            if parts:
+                return {"status": "split", "parts": parts}
+            img_arr = resize_for_ocr(img_arr)
         else:
-            pay_date = extract_payment_date_without_keyword(text)
-        # print("paydate : ", pay_date)
-
-        biz_no = extract_biz_number(lines)
-        # print("biz_no ", biz_no)
-        merchant = extract_merchant_name(lines)
-        amount = extract_payment_amount(lines)
-        
-        # API 호출 및 로그 기록
-        tax_type = "오류"
-        if biz_no and active_key:
-            tax_type = get_tax_type_from_nts_with_api_call_counter(client_ip, biz_no, active_key)
-            tax_type = normalize_tax_type(tax_type)
+            img_arr = get_img_arr_from_file_name(temp_path)
 
-        # 파일명 변경 규칙 적용
-        # [YYMMDD]_[TaxType]_[Amount]_[Merchant]
-        renamed_name     = f"{pay_date}_{tax_type}_{amount}_{merchant}.png"
-        visualized_name  = f"{pay_date}_{tax_type}_{amount}_{merchant}_vis.png"
+        # OCR 전에 중복 영수증인지 확인 (같은 배치 + 최근 배치)
+        # 픽셀이 같으면 이전 결과 재사용, 모양만 비슷하면 OCR 후 주요 필드로 확인 (candidate)
+        content_hash = None
+        candidate = None
+        if dedup_conf and dedup_conf.get("enabled", True):
+            hashes = image_hashes(img_arr)
+            prev, candidate = claim_or_match(client_ip, hashes,
+                                             dedup_conf.get("index_dir", DEDUP_INDEX_DIR),
+                                             dedup_conf.get("threshold", HAMMING_THRESHOLD),
+                                             dedup_conf.get("ttl_hours", 24) * 3600,
+                                             dedup_conf.get("region_threshold", REGION_THRESHOLD))
+            if prev is None:
+                content_hash = hashes["content_hash"]
+            elif prev.get("tax_type") != "오류":
+                reused = reuse_duplicate_result(prev, img_arr, original_filename, result_dir, ocr_vis_dir, raw_dir)
+                if reused is not None:
+                    return reused
+            # 과세유형 조회에 실패했던 결과나 파일을 복원할 수 없는 결과는 재사용하지 않고 다시 처리한다.
 
-        # New
-        # (A) 이름만 바뀐 원본 이미지 저장
-        final_origin_path = os.path.join(result_dir, renamed_name)
-        Image.fromarray(img_arr).save(final_origin_path)
-        
-        # (B) OCR 결과(BB)가 포함된 이미지 별도 저장
-        image_pil = draw_bb_on_img(img_arr, ocr_res)
-        image_pil.save(os.path.join(ocr_vis_dir, visualized_name))
+        try:
+            data = ocr_and_save_receipt(img_arr, original_filename, client_ip, active_key, result_dir, ocr_vis_dir, raw_dir,
+                                        candidate)
+        except Exception:
+            if content_hash: complete_entry(client_ip, content_hash, None, dedup_conf.get("index_dir", DEDUP_INDEX_DIR))
+            raise
+        if content_hash:
+            # 과세유형 "오류" (잘못된 키, 국세청 장애 등) 결과는 인덱스에 남기지 않는다.
+            complete_entry(client_ip, content_hash, None if data["tax_type"] == "오류" else data,
+                           dedup_conf.get("index_dir", DEDUP_INDEX_DIR))
 
         print("End parsing: ", original_filename)
-
-        return {"status": "success",
-                    "data": {
-                        "original_name": original_filename,
-                        "renamed_name": renamed_name,
-                        "vis_name": visualized_name,
-                        "merchant": merchant,
-                        "biz_no": biz_no,
-                        "pay_date": pay_date,
-                        "amount": amount,
-                        "tax_type": tax_type
-                    }
-                }
+        if data.get("duplicate_of"):
+            return {"status": "success", "duplicate": True, "data": data}
+        return {"status": "success", "data": data}
     # except Exception as e:
     #     print("Failed to parse : ", file_info.filename)
     #     return {"status": "error",
@@ -0,0 +1,302 @@
+import os
+import time
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future
+from multiprocessing.connection import wait
+
+# ===============================
+# 관리형 워커 풀 (Managed Worker Pool)
+# ===============================
+# ProcessPoolExecutor 는 워커 하나가 OOM 으로 죽으면 풀 전체가 BrokenProcessPool 이 되어
+# 서버를 재시작할 때까지 모든 업로드가 실패한다.
+# 이 풀은 워커마다 파이프를 따로 두고, 죽은 워커만 새로 띄운다.
+#  - N 개 작업 처리 후 또는 RSS 가 기준을 넘으면 워커 재활용 (PaddleOCR 메모리 누적 방지)
+#  - 작업 중 죽은 워커의 작업은 한 번 재시도, 그래도 실패하면 WorkerCrashedError
+#  - 작업 하나가 task_timeout_sec 를 넘기면 멈춘 워커로 보고 종료 (죽은 워커와 같이 처리)
+# 워커는 spawn 으로 띄운다. 웹 프로세스는 이벤트 루프/스레드 풀 스레드가 도는 중이라 fork 하면
+# 다른 스레드가 잡고 있던 lock(logging, stdout, malloc 등)을 그대로 물려받아 자식이 멈출 수 있다.
+# Executor 를 상속하므로 loop.run_in_executor(pool, ...) 로 그대로 사용할 수 있다.
+
+class WorkerCrashedError(RuntimeError):
+    pass
+
+def get_rss_bytes():
+    """현재 프로세스의 RSS (psutil 없이 /proc 사용, 없으면 최대 RSS)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+def _worker_main(conn, initializer, initargs):
+    # 워커 프로세스 본체: 작업을 받아서 실행하고 결과와 RSS 를 돌려준다.
+    if initializer is not None:
+        try:
+            initializer(*initargs)
+        except Exception:
+            traceback.print_exc()
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        task_id, fn, args, kwargs = msg
+        try:
+            result = ("ok", fn(*args, **kwargs))
+        except Exception as e:
+            traceback.print_exc()
+            result = ("error", e)
+        try:
+            conn.send((task_id, result, get_rss_bytes()))
+        except Exception as e:
+            # 예외 객체가 pickle 되지 않는 경우
+            conn.send((task_id, ("error", RuntimeError(repr(e))), get_rss_bytes()))
+    conn.close()
+
+class _Task:
+    def __init__(self, task_id, future, fn, args, kwargs):
+        self.task_id = task_id
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.attempts = 0
+
+class _Worker:
+    def __init__(self, ctx, initializer=None, initargs=()):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, initializer, initargs), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.task_started_at = None
+        self.timed_out = False
+        self.tasks_done = 0
+        self.rss = 0
+        self.started_at = time.time()
+
+class ManagedWorkerPool(Executor):
+    def __init__(self, max_workers, max_tasks_per_worker=200, rss_limit_bytes=None, max_retries=1,
+                 initializer=None, initargs=(), task_timeout_sec=None, mp_context="spawn"):
+        self._ctx = multiprocessing.get_context(mp_context)
+        # ProcessPoolExecutor 와 같이 워커 프로세스 시작 시 한 번 호출
+        self._initializer = initializer
+        self._initargs = initargs
+        self._max_workers = max(1, max_workers)
+        self._max_tasks_per_worker = max_tasks_per_worker
+        self._rss_limit_bytes = rss_limit_bytes
+        self._max_retries = max_retries
+        self._task_timeout_sec = task_timeout_sec
+
+        self._pending = deque()
+        self._workers = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+        # 관리 스레드 깨우기: 파이프에는 최대 한 개만 쌓이도록 _wakeup_pending 으로 묶는다.
+        # (관리 스레드가 바쁠 때 submit 이 몰려도 파이프가 가득 차서 send 가 막히지 않게)
+        self._wakeup_r, self._wakeup_w = self._ctx.Pipe(duplex=False)
+        self._wakeup_pending = False
+
+        self.stats = {"recycled": 0, "crashed": 0, "timed_out": 0, "retried": 0, "failed": 0}
+
+        # 워커는 첫 submit 때 띄운다. (import 시점에 프로세스를 만들지 않기 위함)
+        self._thread = None
+
+    # --- Executor 인터페이스 ---
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = Future()
+            self._pending.append(_Task(self._next_id, future, fn, args, kwargs))
+            self._next_id += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._manage, daemon=True)
+                self._thread.start()
+            need_wakeup = self._set_wakeup_pending()
+        # send 는 lock 밖에서 (관리 스레드가 _dispatch 에서 같은 lock 을 기다릴 수 있음)
+        if need_wakeup:
+            self._wakeup_w.send(None)
+        return future
+
+    def _set_wakeup_pending(self):
+        # self._lock 을 잡은 상태에서 호출. 이미 깨우기 요청이 있으면 False
+        if self._wakeup_pending:
+            return False
+        self._wakeup_pending = True
+        return True
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while self._pending:
+                    self._pending.popleft().future.cancel()
+            need_wakeup = self._set_wakeup_pending()
+        if need_wakeup:
+            self._wakeup_w.send(None)
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def worker_info(self):
+        """/api/workers 에서 노출할 워커 상태"""
+        return {
+            "workers": [{"pid": w.process.pid,
+                         "busy": w.task is not None,
+                         "tasks_done": w.tasks_done,
+                         "rss_mb": round(w.rss / (1024 * 1024), 1),
+                         "uptime_sec": int(time.time() - w.started_at)}
+                        for w in list(self._workers)],
+            "pending": len(self._pending),
+            **self.stats,
+        }
+
+    # --- 관리 스레드 ---
+    def _manage(self):
+        while True:
+            self._dispatch()
+            with self._lock:
+                if self._shutdown and not self._pending and all(w.task is None for w in self._workers):
+                    break
+
+            conn_map = {w.conn: w for w in self._workers}
+            sentinel_map = {w.process.sentinel: w for w in self._workers}
+            ready = wait([self._wakeup_r, *conn_map, *sentinel_map], timeout=1.0)
+
+            handled = set()
+            for obj in ready:
+                if obj is self._wakeup_r:
+                    # 먼저 읽고 나서 플래그를 내린다. 그 사이에 들어온 작업은 다음 _dispatch 가 가져간다.
+                    while self._wakeup_r.poll():
+                        self._wakeup_r.recv()
+                    with self._lock:
+                        self._wakeup_pending = False
+                    continue
+                worker = conn_map.get(obj) or sentinel_map.get(obj)
+                if worker is None or id(worker) in handled or worker not in self._workers:
+                    continue
+                handled.add(id(worker))
+                if obj is worker.conn:
+                    try:
+                        task_id, result, rss = worker.conn.recv()
+                    except (EOFError, OSError):
+                        self._handle_dead(worker)
+                        continue
+                    self._handle_result(worker, result, rss)
+                else:
+                    # 결과를 보내고 바로 죽은 경우 결과부터 처리
+                    if worker.conn.poll():
+                        try:
+                            task_id, result, rss = worker.conn.recv()
+                            self._handle_result(worker, result, rss)
+                        except (EOFError, OSError):
+                            pass
+                    if worker in self._workers:
+                        self._handle_dead(worker)
+
+            self._kill_timed_out()
+
+        for w in self._workers:
+            self._stop_worker(w)
+        self._workers = []
+
+    def _dispatch(self):
+        # 빈 자리만큼 워커를 띄우고, 놀고 있는 워커에 작업을 넘긴다.
+        while len(self._workers) < self._max_workers and (self._pending or not self._shutdown):
+            self._workers.append(_Worker(self._ctx, self._initializer, self._initargs))
+        for w in self._workers:
+            if w.task is not None:
+                continue
+            task = None
+            with self._lock:
+                while self._pending:
+                    candidate = self._pending.popleft()
+                    if candidate.attempts > 0 or candidate.future.set_running_or_notify_cancel():
+                        task = candidate
+                        break
+            if task is None:
+                break
+            w.task = task
+            w.task_started_at = time.time()
+            try:
+                w.conn.send((task.task_id, task.fn, task.args, task.kwargs))
+            except (OSError, ValueError):
+                # 보내기 전에 이미 죽은 워커: 다음 루프에서 sentinel 로 처리됨
+                pass
+
+    def _handle_result(self, worker, result, rss):
+        task = worker.task
+        worker.task = None
+        worker.tasks_done += 1
+        worker.rss = rss
+        if task is not None:
+            kind, value = result
+            if kind == "ok":
+                task.future.set_result(value)
+            else:
+                task.future.set_exception(value)
+
+        # 재활용 조건 확인
+        too_many = self._max_tasks_per_worker and worker.tasks_done >= self._max_tasks_per_worker
+        too_big = self._rss_limit_bytes and rss > self._rss_limit_bytes
+        if too_many or too_big:
+            print(f"Recycle worker pid={worker.process.pid} tasks={worker.tasks_done} rss={rss // (1024 * 1024)}MB")
+            self.stats["recycled"] += 1
+            self._workers.remove(worker)
+            # 종료 대기(join)는 별도 스레드에서 (관리 스레드가 최대 5초 멈추지 않도록)
+            threading.Thread(target=self._stop_worker, args=(worker,), daemon=True).start()
+
+    def _kill_timed_out(self):
+        # 작업이 task_timeout_sec 를 넘긴 워커는 kill 하고, 다음 루프에서 sentinel 로 _handle_dead 처리
+        if not self._task_timeout_sec:
+            return
+        now = time.time()
+        for w in self._workers:
+            if w.task is not None and not w.timed_out and now - w.task_started_at > self._task_timeout_sec:
+                print(f"Worker timed out pid={w.process.pid} after {int(now - w.task_started_at)}s")
+                w.timed_out = True
+                self.stats["timed_out"] += 1
+                w.process.kill()
+
+    def _handle_dead(self, worker):
+        self.stats["crashed"] += 1
+        # join 해야 exitcode 가 채워진다. (파이프 EOF 를 먼저 받은 경우 아직 종료 중일 수 있음)
+        worker.process.join(timeout=1)
+        print(f"Worker died pid={worker.process.pid} exitcode={worker.process.exitcode}")
+        self._workers.remove(worker)
+        worker.conn.close()
+        task = worker.task
+        if task is None:
+            return
+        if task.attempts < self._max_retries:
+            task.attempts += 1
+            self.stats["retried"] += 1
+            with self._lock:
+                self._pending.appendleft(task)
+        else:
+            self.stats["failed"] += 1
+            reason = "timed out" if worker.timed_out else "died"
+            task.future.set_exception(WorkerCrashedError(
+                f"worker process {reason} (exitcode={worker.process.exitcode})"))
+
+    def _stop_worker(self, worker):
+        try:
+            worker.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        worker.process.join(timeout=5)
+        if worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join()
+        worker.conn.close()